@@ -0,0 +1,392 @@
+# beatclock.py
+#
+# MIDI beat clock and MIDI Time Code (MTC) generation.
+#
+# Defines class 'ClockGenerator', which sends 24-PPQN timing clock (0xF8),
+# start/stop/continue and optionally MTC quarter-frame messages to a MIDI
+# output, from a dedicated timing thread.
+#
+# Pulse times are not accumulated from the previous pulse:  each one is
+# computed from the Scheduler's timeline origin and the TempoMap, so clock
+# output stays phase-locked to scheduled events and does not drift.  A tempo
+# change is inserted at the next pulse, so pulses already sent are unaffected
+# and the pulse interval changes cleanly between one pulse and the next.
+# Tempo changes made while the timing thread runs are serialised with its
+# reads of the TempoMap (and the Scheduler's) by the TempoMap's own lock.
+#
+# After a stop, 'resume' restarts on a 16th note boundary, sending Song
+# Position Pointer before Continue so receivers pick up at the same place.
+#
+# Timing accuracy is recorded in a JitterStats object.
+#
+# See:
+#   https://cmtext.indiana.edu/MIDI/chapter3_system_messages.php
+#   https://en.wikipedia.org/wiki/MIDI_timecode
+#
+
+from collections import deque
+import math
+import os
+import threading
+
+from midiutils import assertEq, MidiMessage
+from tempomap import TempoMap, bpm_to_tempo
+
+CLOCK_PPQN = 24
+
+# Clock pulses per Song Position Pointer 'MIDI beat' (a 16th note)
+PULSES_PER_SPP_BEAT = 6
+MAX_SONG_POSITION   = 16383
+
+# MTC rate codes for supported (non-drop) frame rates
+MTC_RATE_CODES = { 24: 0, 25: 1, 30: 3 }
+
+# ----------------
+# JitterStats class
+# ----------------
+
+class JitterStats:
+    """
+    Accumulates timing errors (actual minus intended send time, in seconds).
+
+    Mean and standard deviation cover all samples;  percentiles cover the most
+    recent 'window' samples.
+    """
+
+    def __init__(self, window=4096):
+        self.count  = 0
+        self.mean   = 0.0
+        self.m2     = 0.0
+        self.max    = 0.0
+        self.recent = deque(maxlen=window)
+        return
+
+    def add(self, error):
+        # Welford's running mean and variance
+        self.count += 1
+        delta       = error - self.mean
+        self.mean  += delta/self.count
+        self.m2    += delta*(error - self.mean)
+        self.max    = max(self.max, abs(error))
+        self.recent.append(error)
+        return
+
+    def stdev(self):
+        return math.sqrt(self.m2/self.count) if self.count else 0.0
+
+    def percentile(self, p):
+        # Returns the p'th percentile (0-100) of recent absolute errors
+        if not self.recent:
+            return 0.0
+        errors = sorted(abs(e) for e in self.recent)
+        return errors[min(len(errors)-1, int(len(errors)*p/100))]
+
+    def summary(self):
+        # Returns a dictionary of statistics, with times in milliseconds
+        return {
+            'count': self.count,
+            'mean':  self.mean*1000,
+            'stdev': self.stdev()*1000,
+            'p99':   self.percentile(99)*1000,
+            'max':   self.max*1000,
+            }
+
+    def __str__(self):
+        s = self.summary()
+        return ( f"{s['count']} samples, mean {s['mean']:.3f}ms, stdev {s['stdev']:.3f}ms, "
+                 f"p99 {s['p99']:.3f}ms, max {s['max']:.3f}ms" )
+
+# --------------------
+# ClockGenerator class
+# --------------------
+
+class ClockGenerator:
+    """
+    Generates MIDI beat clock, and optionally MTC, locked to a Scheduler's timeline.
+    """
+
+    def __init__(self, midiout, scheduler, tempomap=None, mtc_rate=None, spin=0.002):
+        """
+        Create a ClockGenerator object.
+
+        midiout     is the output to which clock messages are sent
+        scheduler   is the Scheduler whose timeline the clock follows
+        tempomap    is the TempoMap giving the tempo;  defaults to the scheduler's
+                    TempoMap, or a fixed 120 BPM if it has none.  The clock reads
+                    it as pulses are generated, so changes to future tempo take
+                    effect when reached.  It may be changed from another thread
+                    while the clock runs, as TempoMap serialises changes and
+                    lookups.
+        mtc_rate    if provided is an MTC frame rate (24, 25 or 30) at which to
+                    send quarter-frame messages
+        spin        is the time (seconds) before each message spent busy-waiting
+                    rather than sleeping, for precise timing with a real clock
+        """
+        if mtc_rate is not None and mtc_rate not in MTC_RATE_CODES:
+            raise ValueError(f"ClockGenerator: unsupported MTC frame rate {mtc_rate}")
+        self.midiout   = midiout
+        self.scheduler = scheduler
+        self.clock     = scheduler.clock
+        self.tempomap  = tempomap or scheduler.tempomap or TempoMap()
+        self.mtc_rate  = mtc_rate
+        self.spin      = spin
+        self.stats     = JitterStats()
+        self.pulse     = 0          # Number of next clock pulse
+        self.quarter   = 0          # Number of next MTC quarter frame
+        self.running   = False
+        self.thread    = None
+        return
+
+    # ---- Timing ----
+
+    def pulse_ticks(self):
+        # Returns number of tempo map ticks between clock pulses
+        return self.tempomap.ppq/CLOCK_PPQN
+
+    def pulse_time(self, n):
+        # Returns clock time of pulse number 'n'
+        return self.scheduler.origin + self.tempomap.tick_to_seconds(n*self.pulse_ticks())
+
+    def quarter_time(self, n):
+        # Returns clock time of MTC quarter frame number 'n'
+        return self.scheduler.origin + n/(4*self.mtc_rate)
+
+    def quarter_message(self, n):
+        # Returns MTC quarter frame message number 'n';  each group of 8 messages
+        # carries the time code of the frame at which the group starts
+        piece  = n % 8
+        frames = (n//8)*2
+        rate   = self.mtc_rate
+        f = frames % rate
+        s = (frames//rate) % 60
+        m = (frames//(rate*60)) % 60
+        h = (frames//(rate*3600)) % 24
+        value  = ( f & 0xF, f >> 4, s & 0xF, s >> 4, m & 0xF, m >> 4, h & 0xF,
+                   (MTC_RATE_CODES[rate] << 1) | (h >> 4) )[piece]
+        return MidiMessage.mtc_quarter_frame(piece, value)
+
+    def set_tempo_bpm(self, bpm):
+        # Change tempo from the next clock pulse onwards;  may be called from
+        # another thread while the timing thread is running
+        self.tempomap.add_tempo(int(round(self.pulse*self.pulse_ticks())), bpm_to_tempo(bpm))
+        return
+
+    # ---- Output ----
+
+    def _emit(self, target, message):
+        # Wait for target time, send message and record the timing error
+        self.clock.wait_until(target, self.spin)
+        self.stats.add(self.clock.now() - target)
+        self.midiout.send(message)
+        return
+
+    def run_until(self, t):
+        """
+        Send all clock and MTC messages due up to clock time 't', in time order.
+        Used by the timing thread, and directly with a virtual clock.
+        """
+        while True:
+            next_pulse   = self.pulse_time(self.pulse)
+            next_quarter = self.quarter_time(self.quarter) if self.mtc_rate else math.inf
+            if min(next_pulse, next_quarter) > t:
+                return
+            if next_pulse <= next_quarter:
+                self._emit(next_pulse, MidiMessage.timing_clock())
+                self.pulse += 1
+            else:
+                self._emit(next_quarter, self.quarter_message(self.quarter))
+                self.quarter += 1
+
+    def start(self, thread=True):
+        """
+        Send start, and begin clock output at the scheduler's timeline origin
+        (which is set to now if the scheduler has not been started).
+
+        thread      if True, clock messages are sent by a timing thread until
+                    'stop' is called;  otherwise the caller calls 'run_until'.
+        """
+        if self.scheduler.origin is None:
+            self.scheduler.start()
+        self.pulse   = 0
+        self.quarter = 0
+        self.midiout.send(MidiMessage.start())
+        self._start_output(thread)
+        return
+
+    def resume(self, thread=True):
+        """
+        Send song position and continue, and resume clock output from the first
+        16th note boundary at or after the current timeline position, so that
+        receivers continue in phase with the timeline.
+        """
+        pos = self.clock.now() - self.scheduler.origin
+        tick = self.tempomap.seconds_to_tick(pos)
+        # Round to avoid a boundary being pushed to the next by float error
+        beats = int(math.ceil(round(tick/(self.pulse_ticks()*PULSES_PER_SPP_BEAT), 6)))
+        if beats > MAX_SONG_POSITION:
+            raise ValueError(f"ClockGenerator: song position {beats} is beyond the MIDI limit")
+        self.pulse = beats*PULSES_PER_SPP_BEAT
+        if self.mtc_rate:
+            secs = self.pulse_time(self.pulse) - self.scheduler.origin
+            self.quarter = int(math.ceil(round(secs*4*self.mtc_rate, 6)))
+        self.midiout.send(MidiMessage.song_position(beats))
+        self.midiout.send(MidiMessage.continue_())
+        self._start_output(thread)
+        return
+
+    def stop(self):
+        # Stop clock output and send stop
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        self.midiout.send(MidiMessage.stop())
+        return
+
+    def _start_output(self, thread):
+        self.running = True
+        if thread:
+            self.thread = threading.Thread(target=self._run, name="ClockGenerator", daemon=True)
+            self.thread.start()
+        return
+
+    def _run(self):
+        # Timing thread:  raise priority where permitted, then send each message
+        # as it falls due.  Waits are short so 'stop' takes effect promptly.
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+        except (AttributeError, OSError):
+            pass
+        while self.running:
+            next_pulse = self.pulse_time(self.pulse)
+            if self.mtc_rate:
+                next_pulse = min(next_pulse, self.quarter_time(self.quarter))
+            self.clock.sleep_until(min(next_pulse - self.spin, self.clock.now() + 0.05))
+            if self.running and self.clock.now() >= next_pulse - self.spin:
+                self.run_until(next_pulse)
+        return
+
+# ---- Test ----
+if __name__ == "__main__":
+    from clocks import VirtualClock, RealClock
+    from midiout import LoopbackMidiOut
+    from scheduler import Scheduler
+    # Virtual clock:  pulse times follow the tempo map exactly, through a tempo change
+    tm  = TempoMap(ppq=480)
+    tm.add_tempo_bpm(960, 60)
+    out = LoopbackMidiOut(VirtualClock(5.0))
+    gen = ClockGenerator(out, Scheduler(out, tempomap=tm))
+    gen.start(thread=False)
+    gen.run_until(5.0 + 2.0)
+    pulses = [t for t, m in out.sent if m == [0xF8]]
+    assertEq(out.sent[0], (5.0, [0xFA]))
+    assertEq(len(pulses), 48+24+1)
+    assertEq(round(pulses[48]-pulses[47], 9), round(1/48, 9))
+    assertEq(round(pulses[49]-pulses[48], 9), round(1/24, 9))
+    assertEq(pulses[-1], 7.0)
+    # Tempo change from the next pulse
+    gen.set_tempo_bpm(120)
+    gen.run_until(5.0 + 2.5)
+    pulses = [t for t, m in out.sent if m == [0xF8]]
+    assertEq(round(pulses[-1]-pulses[-2], 9), round(1/48, 9))
+    assertEq(len(pulses), 73+23)
+    gen.stop()
+    assertEq(out.sent[-1][1], [0xFC])
+    assertEq(gen.stats.max, 0.0)
+    # MTC at 25 fps:  quarter frames every 10ms
+    out = LoopbackMidiOut(VirtualClock())
+    gen = ClockGenerator(out, Scheduler(out), mtc_rate=25)
+    gen.start(thread=False)
+    gen.run_until(1.08)
+    quarters = [(t, m) for t, m in out.sent if m[0] == 0xF1]
+    assertEq(len(quarters), 109)
+    assertEq([m[1] for _, m in quarters[:8]], [0x00, 0x10, 0x20, 0x30, 0x40, 0x50, 0x60, 0x72])
+    # Group starting at frame 24 (00:00:00:24), then frame 26 (00:00:01:01)
+    assertEq([m[1] for _, m in quarters[96:100]], [0x08, 0x11, 0x20, 0x30])
+    assertEq([m[1] for _, m in quarters[104:108]], [0x01, 0x10, 0x21, 0x30])
+    assertEq(abs(quarters[104][0] - 1.04) < 1e-9, True)
+    # Resume part way through, at 1.58s:  the next 16th note boundary (120 ticks
+    # at 120 BPM) is 16th note 13, at 1.625s
+    gen.stop()
+    out.clock.sleep(0.5)
+    n = len(out.sent)
+    gen.resume(thread=False)
+    assertEq((gen.pulse, gen.quarter), (13*6, 163))
+    assertEq(out.sent[n:], [(1.58, [0xF2, 13, 0]), (1.58, [0xFB])])
+    gen.run_until(1.7)
+    pulses = [t for t, m in out.sent[n:] if m == [0xF8]]
+    assertEq(round(pulses[0], 9), 1.625)
+    assertEq(round(pulses[1]-pulses[0], 9), round(1/48, 9))
+    # Resuming exactly on a boundary starts there
+    out = LoopbackMidiOut(VirtualClock())
+    gen = ClockGenerator(out, Scheduler(out))
+    gen.start(thread=False)
+    gen.stop()
+    out.clock.sleep(2.0)
+    gen.resume(thread=False)
+    assertEq((gen.pulse, out.sent[-2][1]), (16*6, [0xF2, 16, 0]))
+    # Real clock and timing thread, for jitter statistics
+    out = LoopbackMidiOut(RealClock())
+    gen = ClockGenerator(out, Scheduler(out), tempomap=TempoMap(tempo=bpm_to_tempo(240)), mtc_rate=30)
+    gen.start()
+    out.clock.sleep(1.0)
+    gen.stop()
+    print(f"Real-time clock jitter: {gen.stats}")
+    # Real clock, with tempo changed repeatedly from this thread while the
+    # timing thread runs:  the thread must survive, and no pulse may come early
+    out = LoopbackMidiOut(RealClock())
+    gen = ClockGenerator(out, Scheduler(out), tempomap=TempoMap(tempo=bpm_to_tempo(240)))
+    gen.start()
+    for i in range(2000):
+        gen.set_tempo_bpm(240 if i % 2 else 480)
+        out.clock.sleep(0.0002)
+    assertEq(gen.thread.is_alive(), True)
+    gen.stop()
+    pulses = [t for t, m in out.sent if m == [0xF8]]
+    # Each tempo change applies from a pulse not yet sent, so the final tempo map
+    # gives the time each pulse was due:  none may have been sent before it
+    assertEq([n for n, t in enumerate(pulses) if t < gen.pulse_time(n) - 1e-6], [])
+    assertEq(len(pulses) > 0.5*96, True)
+    print(f"Real-time clock with tempo changes: {len(pulses)} pulses, {gen.stats}")
+    # Stress:  pulse times, and times through a Scheduler sharing the same
+    # TempoMap, read in other threads while tempo changes in this one
+    out = LoopbackMidiOut(VirtualClock(1.0))
+    sch = Scheduler(out, tempomap=TempoMap())
+    gen = ClockGenerator(out, sch)
+    sch.start(origin=0.0)
+    errors = []
+    done   = threading.Event()
+    def reader():
+        n = 1
+        while not done.is_set():
+            try:
+                if gen.pulse_time(n) <= 0.0:
+                    errors.append(n)
+            except Exception as e:
+                errors.append(e)
+            n += 1
+        return
+    def scheduler_reader():
+        while not done.is_set():
+            try:
+                # Ticks just after the pulse at which tempo is being changed
+                tick = gen.pulse*gen.pulse_ticks() + 1
+                if sch.timeline_to_clock(tick) <= 0.0 or sch.position() <= 0.0:
+                    errors.append(tick)
+            except Exception as e:
+                errors.append(e)
+        return
+    sched_thread = threading.Thread(target=scheduler_reader)
+    sched_thread.start()
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(20000):
+        gen.pulse = i
+        gen.set_tempo_bpm(100 + i % 100)
+    done.set()
+    thread.join()
+    sched_thread.join()
+    assertEq(errors[:5], [])
+# ----
+
+# End.
@@ -0,0 +1,345 @@
+# ccstate.py
+#
+# Controller and program state cache for a MIDI output port.
+#
+# Keeps track of the last value sent for every controller and program on each
+# channel of a port, so that messages which would not change the receiver's
+# state can be dropped before they are sent.  Over a bandwidth-limited link
+# (such as Bluetooth LE MIDI) this removes the repeated program changes and
+# controller values that generators tend to emit.
+#
+# Also encodes multi-message values - 14-bit controllers, bank select (MSB+LSB)
+# and RPN/NRPN parameters - sending only the component messages that change.
+#
+# Controller semantics followed here (per the MIDI 1.0 specification):
+#   - when a controller MSB (0-31) is received, the matching LSB (32-63) is reset to 0;
+#   - data entry (6/38) applies to the currently selected RPN or NRPN;
+#   - a bank select takes effect on the next program change, so that program
+#     change must be sent even if the program number is unchanged.
+#
+# See: https://www.midi.org/specifications-old/item/table-3-control-change-messages-data-bytes-2
+#
+
+from midiutils import assertEq, Patch, MidiMessage
+
+# Controllers that trigger an action rather than set a value, and so are never dropped
+ACTION_CONTROLLERS = frozenset(
+    [ MidiMessage.CC_DATA_INCREMENT, MidiMessage.CC_DATA_DECREMENT ] +
+    list(range(120, 128))   # Channel mode messages
+    )
+
+DATA_ENTRY_CONTROLLERS = frozenset(
+    [ MidiMessage.CC_DATA_ENTRY, MidiMessage.CC_DATA_ENTRY+MidiMessage.CC_LSB_OFFSET
+    , MidiMessage.CC_DATA_INCREMENT, MidiMessage.CC_DATA_DECREMENT
+    ])
+
+PARAM_SELECT_CONTROLLERS = frozenset(
+    [ MidiMessage.CC_NRPN_LSB, MidiMessage.CC_NRPN_MSB
+    , MidiMessage.CC_RPN_LSB,  MidiMessage.CC_RPN_MSB
+    ])
+
+OTHER_PARAM_SELECT = {
+    MidiMessage.CC_NRPN_LSB: (MidiMessage.CC_RPN_MSB,  MidiMessage.CC_RPN_LSB),
+    MidiMessage.CC_NRPN_MSB: (MidiMessage.CC_RPN_MSB,  MidiMessage.CC_RPN_LSB),
+    MidiMessage.CC_RPN_LSB:  (MidiMessage.CC_NRPN_MSB, MidiMessage.CC_NRPN_LSB),
+    MidiMessage.CC_RPN_MSB:  (MidiMessage.CC_NRPN_MSB, MidiMessage.CC_NRPN_LSB),
+    }
+
+BANK_CONTROLLERS = frozenset(
+    [ MidiMessage.CC_BANK_SELECT, MidiMessage.CC_BANK_SELECT+MidiMessage.CC_LSB_OFFSET ])
+
+# ---------------------
+# ControllerCache class
+# ---------------------
+
+class ControllerCache:
+    """
+    Last-sent controller and program state for the 16 channels of one port.
+
+    Methods other than 'filter' return a list of the messages that need to be
+    sent (possibly empty), and update the cache on the assumption that they
+    will be.  'filter' takes a single message and returns it, or None if it
+    should be dropped.
+
+    A value of None in the cache means the receiver's state is unknown, so the
+    next message for that controller is always sent.
+    """
+
+    def __init__(self):
+        self.reset()
+        return
+
+    def reset(self, channel=None):
+        # Forget cached state, for one channel (1-16) or all channels,
+        # e.g. after the receiving device has been reconnected
+        channels = range(16) if channel is None else [channel-1]
+        if channel is None:
+            self.cc           = [None]*16
+            self.program      = [None]*16
+            self.bank_pending = [False]*16
+            self.params       = [None]*16
+            self.sent         = 0
+            self.suppressed   = 0
+        for ch in channels:
+            self.cc[ch]           = [None]*128
+            self.program[ch]      = None
+            self.bank_pending[ch] = False
+            self.params[ch]       = {}
+        return
+
+    def _cc(self, ch, controller, value, out):
+        # Append a control change on zero-based channel 'ch' to 'out' if it
+        # changes the cached state, and update the cache accordingly.
+        state = self.cc[ch]
+        if state[controller] == value and controller not in ACTION_CONTROLLERS:
+            self.suppressed += 1
+            return
+        state[controller] = value
+        if controller < 32:
+            state[controller+MidiMessage.CC_LSB_OFFSET] = 0
+        if controller in BANK_CONTROLLERS:
+            self.bank_pending[ch] = True
+        elif controller in PARAM_SELECT_CONTROLLERS or controller in ACTION_CONTROLLERS:
+            # Data entry now refers to a different parameter, or has moved
+            state[MidiMessage.CC_DATA_ENTRY] = None
+            state[MidiMessage.CC_DATA_ENTRY+MidiMessage.CC_LSB_OFFSET] = None
+        if controller in PARAM_SELECT_CONTROLLERS:
+            # Receiver uses whichever of RPN/NRPN was selected last
+            other = OTHER_PARAM_SELECT[controller]
+            if state[other[0]] is not None or state[other[1]] is not None:
+                state[other[0]] = state[other[1]] = None
+                for c in PARAM_SELECT_CONTROLLERS - set(other) - {controller}:
+                    state[c] = None
+        if controller == MidiMessage.CC_RESET_ALL:
+            # Reset all controllers leaves bank select and program unchanged
+            for c in range(120):
+                if c not in BANK_CONTROLLERS:
+                    state[c] = None
+            self.params[ch].clear()
+        self.sent += 1
+        out.append([0xB0+ch, controller, value])
+        return
+
+    def control_change(self, channel, controller, value):
+        # Returns list of messages needed to set a 7-bit controller value
+        out = []
+        if controller in DATA_ENTRY_CONTROLLERS:
+            # Raw data entry:  cached parameter values may no longer be accurate
+            self.params[channel-1].clear()
+        self._cc(channel-1, controller, value, out)
+        return out
+
+    def control_change_14bit(self, channel, controller, value):
+        # Returns list of messages needed to set a 14-bit controller value
+        # (controller 0-31 carries the MSB, controller+32 the LSB)
+        out = []
+        if controller+MidiMessage.CC_LSB_OFFSET in DATA_ENTRY_CONTROLLERS:
+            self.params[channel-1].clear()
+        self._cc(channel-1, controller,                           value >> 7,   out)
+        self._cc(channel-1, controller+MidiMessage.CC_LSB_OFFSET, value & 0x7F, out)
+        return out
+
+    def program_change(self, channel, patch, banknum=None):
+        """
+        Returns list of messages needed to select a patch, and optionally a bank.
+
+        channel     MIDI channel number 1-16
+        patch       Patch object to be used with designated channel
+        banknum     if provided is the bank number 0-16383, sent as MSB and LSB
+        """
+        ch  = channel-1
+        out = []
+        if banknum is not None:
+            self._cc(ch, MidiMessage.CC_BANK_SELECT,                           banknum >> 7,   out)
+            self._cc(ch, MidiMessage.CC_BANK_SELECT+MidiMessage.CC_LSB_OFFSET, banknum & 0x7F, out)
+        if self.program[ch] == patch.patchnum and not self.bank_pending[ch]:
+            self.suppressed += 1
+        else:
+            out.append(MidiMessage.program_change(channel, patch))
+            self.program[ch]      = patch.patchnum
+            self.bank_pending[ch] = False
+            self.sent += 1
+        return out
+
+    def parameter(self, channel, param, value, registered=True):
+        """
+        Returns list of messages needed to set an RPN or NRPN parameter value.
+
+        Nothing is sent if the parameter already has this value.  Otherwise the
+        parameter is selected (unless already selected) and only the data entry
+        bytes that differ from the last data entry are sent.
+        """
+        ch  = channel-1
+        key = (registered, param)
+        out = []
+        if self.params[ch].get(key) == value:
+            self.suppressed += 1
+            return out
+        if registered:
+            msb, lsb = MidiMessage.CC_RPN_MSB,  MidiMessage.CC_RPN_LSB
+        else:
+            msb, lsb = MidiMessage.CC_NRPN_MSB, MidiMessage.CC_NRPN_LSB
+        self._cc(ch, msb, param >> 7,   out)
+        self._cc(ch, lsb, param & 0x7F, out)
+        self._cc(ch, MidiMessage.CC_DATA_ENTRY,                           value >> 7,   out)
+        self._cc(ch, MidiMessage.CC_DATA_ENTRY+MidiMessage.CC_LSB_OFFSET, value & 0x7F, out)
+        self.params[ch][key] = value
+        return out
+
+    def filter(self, message):
+        """
+        Returns the supplied message if it changes cached state (or is not a
+        controller or program message), otherwise None.
+        """
+        status = message[0] & 0xF0
+        ch     = message[0] & 0x0F
+        if status == 0xB0:
+            out = self.control_change(ch+1, message[1], message[2])
+            return out[0] if out else None
+        if status == 0xC0:
+            if self.program[ch] == message[1]+1 and not self.bank_pending[ch]:
+                self.suppressed += 1
+                return None
+            self.program[ch]      = message[1]+1
+            self.bank_pending[ch] = False
+            self.sent += 1
+        return message
+
+# ---------------------
+# CachedMidiOut class
+# ---------------------
+
+class CachedMidiOut:
+    """
+    Wraps a MIDI output (any object with a 'send' method, such as MidiOut), and
+    drops controller and program messages that would not change its state.
+
+    Use one CachedMidiOut per port, since the cache describes a single receiver.
+    """
+
+    def __init__(self, midiout, cache=None):
+        self.midiout = midiout
+        self.cache   = cache if cache is not None else ControllerCache()
+        return
+
+    @property
+    def clock(self):
+        # The wrapped output's clock, used to time playback to this output
+        return self.midiout.clock
+
+    def send(self, message):
+        # Send Midi message (or list of messages), dropping those that change nothing
+        if isinstance(message[0],list):
+            for m in message:
+                self.send(m)
+        else:
+            message = self.cache.filter(message)
+            if message:
+                self.midiout.send(message)
+        return
+
+    def _send_all(self, messages):
+        for m in messages:
+            self.midiout.send(m)
+        return
+
+    def control_change(self, channel, controller, value):
+        self._send_all(self.cache.control_change(channel, controller, value))
+        return
+
+    def control_change_14bit(self, channel, controller, value):
+        self._send_all(self.cache.control_change_14bit(channel, controller, value))
+        return
+
+    def program_change(self, channel, patch, banknum=None):
+        self._send_all(self.cache.program_change(channel, patch, banknum))
+        return
+
+    def rpn(self, channel, param, value):
+        self._send_all(self.cache.parameter(channel, param, value, registered=True))
+        return
+
+    def nrpn(self, channel, param, value):
+        self._send_all(self.cache.parameter(channel, param, value, registered=False))
+        return
+
+# ---- Test ----
+if __name__ == "__main__":
+    class CollectOut:
+        def __init__(self):
+            self.sent = []
+        def send(self, message):
+            self.sent.append(message)
+    def sent_since(out, n):
+        return out.sent[n:]
+
+    out = CollectOut()
+    mo  = CachedMidiOut(out)
+    # Repeated program change is dropped
+    mo.send(MidiMessage.program_change(1, Patch.GRAND_PIANO))
+    mo.send(MidiMessage.program_change(1, Patch.GRAND_PIANO))
+    mo.send(MidiMessage.program_change(2, Patch.GRAND_PIANO))
+    assertEq(out.sent, [[0xC0, 0], [0xC1, 0]])
+    # Bank change forces program change to be resent
+    n = len(out.sent)
+    mo.program_change(1, Patch.GRAND_PIANO, banknum=129)
+    assertEq(sent_since(out, n), [[0xB0, 0, 1], [0xB0, 32, 1], [0xC0, 0]])
+    n = len(out.sent)
+    mo.program_change(1, Patch.GRAND_PIANO, banknum=130)
+    assertEq(sent_since(out, n), [[0xB0, 32, 2], [0xC0, 0]])
+    n = len(out.sent)
+    mo.program_change(1, Patch.GRAND_PIANO, banknum=130)
+    assertEq(sent_since(out, n), [])
+    # 14-bit controllers:  LSB-only change, and MSB change implying LSB reset to 0
+    n = len(out.sent)
+    mo.control_change_14bit(1, MidiMessage.CC_VOLUME, 1000)
+    mo.control_change_14bit(1, MidiMessage.CC_VOLUME, 1001)
+    mo.control_change_14bit(1, MidiMessage.CC_VOLUME, 1024)
+    assertEq(sent_since(out, n),
+        [[0xB0, 7, 7], [0xB0, 39, 104], [0xB0, 39, 105], [0xB0, 7, 8]])
+    # Raw CC filtering
+    n = len(out.sent)
+    mo.send([[0xB0, 10, 64], [0xB0, 10, 64], [0x90, 60, 64], [0x90, 60, 64]])
+    assertEq(sent_since(out, n), [[0xB0, 10, 64], [0x90, 60, 64], [0x90, 60, 64]])
+    # RPN then NRPN, then back to RPN
+    n = len(out.sent)
+    mo.rpn(1, MidiMessage.RPN_PITCH_BEND_RANGE, 12 << 7)
+    # (LSB of 0 is implied by sending the MSB)
+    assertEq(sent_since(out, n), [[0xB0, 101, 0], [0xB0, 100, 0], [0xB0, 6, 12]])
+    n = len(out.sent)
+    mo.rpn(1, MidiMessage.RPN_PITCH_BEND_RANGE, 12 << 7)
+    mo.rpn(1, MidiMessage.RPN_PITCH_BEND_RANGE, (12 << 7) + 50)
+    assertEq(sent_since(out, n), [[0xB0, 38, 50]])
+    n = len(out.sent)
+    mo.nrpn(1, 0x0105, 100)
+    mo.rpn(1, MidiMessage.RPN_FINE_TUNING, 100)
+    assertEq(sent_since(out, n),
+        [ [0xB0, 99, 2], [0xB0, 98, 5], [0xB0, 6, 0], [0xB0, 38, 100]
+        , [0xB0, 101, 0], [0xB0, 100, 1], [0xB0, 6, 0], [0xB0, 38, 100]
+        ])
+    # Reset all controllers clears cached values
+    n = len(out.sent)
+    mo.control_change(1, MidiMessage.CC_RESET_ALL, 0)
+    mo.control_change(1, MidiMessage.CC_PAN, 64)
+    mo.control_change(1, MidiMessage.CC_PAN, 64)
+    assertEq(sent_since(out, n), [[0xB0, 121, 0], [0xB0, 10, 64]])
+    # Counts cover controller and program messages only, not the note messages
+    assertEq(mo.cache.sent, len([m for m in out.sent if m[0] & 0xF0 in (0xB0, 0xC0)]))
+    print(f"ControllerCache: sent {mo.cache.sent}, suppressed {mo.cache.suppressed}")
+    # Clocked playback through the cache uses the wrapped output's clock
+    from clocks import VirtualClock
+    from midiout import LoopbackMidiOut
+    import playback
+    out = LoopbackMidiOut(VirtualClock())
+    mo  = CachedMidiOut(out)
+    assertEq(mo.clock, out.clock)
+    playback.play_Cmaj_chords(mo, verbose=False)
+    playback.play_Cmaj_chords(mo, verbose=False)
+    # The second program change is dropped;  all notes are sent, in virtual time
+    expected = playback.record("chords")
+    assertEq(out.sent[:len(expected)], expected)
+    assertEq(len(out.sent), 2*len(expected) - 1)
+    assertEq(round(out.sent[-1][0], 6), round(2*expected[-1][0] + 0.05, 6))
+# ----
+
+# End.
@@ -0,0 +1,104 @@
+# clocks.py
+#
+# Injectable clocks for timing MIDI playback.
+#
+# Playback code takes a clock object rather than calling time.sleep directly,
+# so the same code can run against:
+#
+#   'RealClock'     wall-clock time, for playing to a real MIDI port;
+#   'VirtualClock'  simulated time that advances only when slept on, so a
+#                   playback scenario taking minutes completes in milliseconds
+#                   and produces exactly repeatable timestamps.
+#
+# Both provide:
+#
+#   now()               current time in seconds
+#   sleep(secs)         wait for a duration
+#   sleep_until(t)      wait until clock time 't' (returns at once if already past)
+#   wait_until(t)       as sleep_until, but finishing with a busy-wait for precision
+#
+
+import time
+
+from midiutils import assertEq
+
+# ---------------
+# RealClock class
+# ---------------
+
+class RealClock:
+    """
+    Clock reading time.perf_counter, and waiting with time.sleep.
+    """
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, secs):
+        if secs > 0:
+            time.sleep(secs)
+        return
+
+    def sleep_until(self, t):
+        self.sleep(t - time.perf_counter())
+        return
+
+    def wait_until(self, t, spin=0.002):
+        # Precise wait:  sleep until 'spin' seconds before 't', then busy-wait,
+        # since time.sleep may overshoot by a scheduler quantum
+        self.sleep(t - spin - time.perf_counter())
+        while time.perf_counter() < t:
+            pass
+        return
+
+# ------------------
+# VirtualClock class
+# ------------------
+
+class VirtualClock:
+    """
+    Simulated clock:  time stands still except when a caller sleeps.
+    """
+
+    def __init__(self, start=0.0):
+        self.t = start
+        return
+
+    def now(self):
+        return self.t
+
+    def sleep(self, secs):
+        if secs > 0:
+            self.t += secs
+        return
+
+    def sleep_until(self, t):
+        if t > self.t:
+            self.t = t
+        return
+
+    def wait_until(self, t, spin=0.0):
+        self.sleep_until(t)
+        return
+
+# Clock used when none is supplied
+DEFAULT_CLOCK = RealClock()
+
+# ---- Test ----
+if __name__ == "__main__":
+    vc = VirtualClock()
+    vc.sleep(0.25)
+    vc.sleep(-1)
+    vc.sleep_until(0.2)
+    assertEq(vc.now(), 0.25)
+    vc.sleep_until(3600)
+    assertEq(vc.now(), 3600)
+    rc = RealClock()
+    t0 = rc.now()
+    rc.sleep_until(t0+0.01)
+    assertEq(rc.now() >= t0+0.01, True)
+    rc.wait_until(t0+0.02)
+    assertEq(rc.now()-(t0+0.02) < 0.001, True)
+# ----
+
+# End.
@@ -0,0 +1,237 @@
+# midicli.py
+#
+# Command line interface.
+#
+#   python midicli.py list-ports [--backend pygame]
+#   python midicli.py play PIECE [--port-name NAME | --port-number N] [--backend pygame]
+#   python midicli.py render PIECE -o OUTPUT.mid [--ppq N] [--bpm N]
+#   python midicli.py bench [--runs N]
+#
+# 'play' and 'render' accept '--trace FILE' to record the playback pipeline
+# (see module 'tracing'), writing a Chrome trace to FILE and a per-stage
+# summary to stderr.  '--trace-seconds N' stops tracing after N seconds.
+#
+# PIECE is the name of one of the playback routines in module 'playback'
+# (scales, chords, arpeggios, keysig-scales), or for 'play' the path of a
+# Standard MIDI File.
+#
+# Startup time matters for a command line tool, so this module imports only
+# what argument parsing needs.  Each subcommand imports its own modules when
+# it runs, and MIDI backends (rtmidi, pygame) are imported only by the
+# subcommands that talk to a device:  'render' and 'bench' never load them,
+# and 'list-ports' loads only the backend asked for.
+#
+
+import argparse
+import sys
+
+BACKENDS = ("rtmidi", "pygame")
+
+# Subcommands timed by 'bench' for cold start
+BENCH_COMMANDS = (
+    ["--help"],
+    ["list-ports"],
+    ["render", "chords", "-o", None],
+    )
+
+def _backend_error(backend, e):
+    print(f"midicli: cannot use MIDI backend '{backend}' ({e})", file=sys.stderr)
+    return 1
+
+# ---- list-ports ----
+
+def list_ports(args):
+    if args.backend == "pygame":
+        try:
+            import pygame.midi
+        except ImportError as e:
+            return _backend_error(args.backend, e)
+        pygame.midi.init()
+        try:
+            for i in range(pygame.midi.get_count()):
+                interface, name, is_input, is_output, opened = pygame.midi.get_device_info(i)
+                if is_output:
+                    print(f"Port {i:02d}: {name.decode()} ({interface.decode()})")
+        finally:
+            pygame.midi.quit()
+    else:
+        try:
+            import rtmidi
+        except ImportError as e:
+            return _backend_error(args.backend, e)
+        for i, name in enumerate(rtmidi.MidiOut().get_ports()):
+            print(f"Port {i:02d}: {name:s}")
+    return 0
+
+# ---- play ----
+
+def _file_events(path):
+    # Returns generator of (seconds, message) events from a MIDI file
+    from smf import SMFReader
+    from streaming import merge_tracks, timed_events
+    reader = SMFReader(path)
+    return timed_events(merge_tracks(reader), reader.ppq)
+
+def play(args):
+    import playback
+    if args.piece not in playback.PIECES and not args.piece.endswith((".mid", ".midi")):
+        print(f"midicli: unknown piece '{args.piece}'", file=sys.stderr)
+        return 2
+    if args.backend == "pygame":
+        # PortMidi does the timing:  events are handed over a block at a time,
+        # a little ahead of when they fall due, and files are read as they play
+        if args.port_name is not None:
+            print(f"midicli: --port-name is not supported by the pygame backend;  "
+                  f"use --port-number", file=sys.stderr)
+            return 2
+        try:
+            import time
+            from pygamemidi import PygameMidiOut
+        except ImportError as e:
+            return _backend_error(args.backend, e)
+        if args.piece in playback.PIECES:
+            events = playback.record(args.piece)
+        else:
+            events = _file_events(args.piece)
+        midiout = PygameMidiOut(args.port_number)
+        try:
+            midiout.stream(events)
+            time.sleep(0.5)
+        finally:
+            midiout.close()
+        return 0
+    try:
+        from midiout import MidiOut
+        midiout = MidiOut(port_number=args.port_number, port_name=args.port_name)
+    except ImportError as e:
+        return _backend_error(args.backend, e)
+    try:
+        if args.piece in playback.PIECES:
+            playback.PIECES[args.piece](midiout, verbose=not args.quiet)
+        else:
+            from streaming import play_file
+            play_file(args.piece, midiout)
+    finally:
+        midiout.midi_close()
+    return 0
+
+# ---- render ----
+
+def render(args):
+    import playback
+    from smf import SMFWriter, tempo_message
+    from tempomap import TempoMap, bpm_to_tempo
+    if args.piece not in playback.PIECES:
+        print(f"midicli: unknown piece '{args.piece}'", file=sys.stderr)
+        return 2
+    tempo    = bpm_to_tempo(args.bpm)
+    tempomap = TempoMap(ppq=args.ppq, tempo=tempo)
+    events   = [ (int(round(tempomap.seconds_to_tick(t))), m)
+                 for t, m in playback.record(args.piece) ]
+    with SMFWriter(args.output, ppq=args.ppq, format=0) as w:
+        count = w.write_track([(0, tempo_message(tempo))] + events)
+    if not args.quiet:
+        print(f"Wrote {count} events to {args.output}")
+    return 0
+
+# ---- bench ----
+
+def startup_times(command, runs):
+    # Returns wall-clock times (seconds) of 'runs' cold starts of this module
+    # with the given arguments, and the exit status of the last run
+    import subprocess
+    import time
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        status = subprocess.run([sys.executable, __file__] + command,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        times.append(time.perf_counter() - t0)
+    return (times, status)
+
+def bench(args):
+    import os
+    import statistics
+    import tempfile
+    import time
+    import playback
+    fd, path = tempfile.mkstemp(suffix=".mid")
+    os.close(fd)
+    try:
+        print("Cold start:")
+        for command in BENCH_COMMANDS:
+            command = [path if a is None else a for a in command]
+            times, status = startup_times(command, args.runs)
+            note = "" if status == 0 else f" (exit status {status})"
+            print(f"  {' '.join(command[:2]):20s} min {min(times)*1000:6.1f}ms, "
+                  f"median {statistics.median(times)*1000:6.1f}ms{note}")
+    finally:
+        os.remove(path)
+    print("Simulated-time playback:")
+    for name in playback.PIECES:
+        t0   = time.perf_counter()
+        sent = playback.record(name)
+        t1   = time.perf_counter()
+        print(f"  {name:20s} {len(sent):5d} events, {sent[-1][0]:6.1f}s of music "
+              f"in {(t1-t0)*1000:6.1f}ms")
+    return 0
+
+# ---- Argument parsing ----
+
+def add_trace_arguments(p):
+    p.add_argument("--trace", metavar="FILE", default=None,
+        help="write a Chrome trace of the playback pipeline to FILE")
+    p.add_argument("--trace-seconds", type=float, default=None,
+        help="stop tracing after this many seconds")
+    return
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="midicli", description="MIDI doodling tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("list-ports", help="list MIDI output ports")
+    p.add_argument("--backend", choices=BACKENDS, default="rtmidi")
+    p.set_defaults(handler=list_ports)
+
+    p = commands.add_parser("play", help="play a piece or MIDI file to a port")
+    p.add_argument("piece", help="piece name, or path of a MIDI file")
+    p.add_argument("--backend", choices=BACKENDS, default="rtmidi")
+    port = p.add_mutually_exclusive_group()
+    port.add_argument("--port-number", type=int, default=None)
+    port.add_argument("--port-name", default=None,
+        help="name of port (rtmidi only);  a virtual port is created if not found")
+    p.add_argument("--quiet", "-q", action="store_true")
+    add_trace_arguments(p)
+    p.set_defaults(handler=play)
+
+    p = commands.add_parser("render", help="render a piece to a Standard MIDI File")
+    p.add_argument("piece", help="piece name")
+    p.add_argument("--output", "-o", required=True)
+    p.add_argument("--ppq", type=int, default=480)
+    p.add_argument("--bpm", type=float, default=120)
+    p.add_argument("--quiet", "-q", action="store_true")
+    add_trace_arguments(p)
+    p.set_defaults(handler=render)
+
+    p = commands.add_parser("bench", help="time startup and simulated playback")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(handler=bench)
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if not getattr(args, "trace", None):
+        return args.handler(args)
+    from tracing import start_tracing
+    tracer = start_tracing(seconds=args.trace_seconds)
+    try:
+        return args.handler(args)
+    finally:
+        tracer.stop()
+        tracer.write_chrome_trace(args.trace)
+        print(tracer.format_summary(), file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# End.
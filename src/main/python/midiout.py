@@ -0,0 +1,174 @@
+# midiout.py
+#
+# MIDI output ports.
+#
+# Defines 'MidiOut', which sends MidiMessage byte lists to a port via rtmidi,
+# and 'LoopbackMidiOut', which records them with timestamps from a clock so
+# that playback code can be run and checked without any MIDI device.
+#
+# Each output carries the clock used to time messages sent to it (see module
+# 'clocks'), so playback code can wait with 'midiout.clock.sleep' and run at
+# real time or at simulated time alike.
+#
+# rtmidi is imported only when a real port is opened.
+#
+
+from midiutils import assertEq, Note, MidiMessage
+from clocks import DEFAULT_CLOCK, VirtualClock
+
+# -------------
+# MidiOut class
+# -------------
+
+class MidiOut:
+
+    def midi_open(self):
+       if not self.midiout:
+            import rtmidi
+            self.midiout         = rtmidi.MidiOut()
+            self.available_ports = self.midiout.get_ports()
+
+    def midi_close(self):
+        if self.midiout:
+            # self.midiout.close()
+            del self.midiout
+            self.midiout = None
+        return
+
+    def get_port_name(self, port_num):
+        if self.available_ports:
+            return self.available_ports[port_num]
+        else:
+            print(f"MidiOut.get_port_name: cannot find available Midi ports")
+        return None
+
+    def get_port_num(self, port_name):
+        if self.available_ports:
+            for i in range(len(self.available_ports)):
+                if port_name in self.available_ports[i]:
+                    return i
+            print(f"MidiOut.get_port_num: MIDI port '{port_name}' not found")
+        else:
+            print(f"MidiOut.get_port_num: cannot find available MIDI ports")
+        return None
+
+    def print_port_info(self):
+        for i in range(len(self.available_ports)):
+            print(f"Port {i:02d}: {self.available_ports[i]:s}")
+        return
+
+    def __init__(self, port_number=None, port_name=None, clock=None):
+        # Open a Midi port.
+        #
+        # port_number   if provided is the (system dependent) number of a Midi port 
+        #               to which Midi data will be sent
+        # port_name     if provided is the (system dependent) name of a Midi port 
+        #               to which Midi data will be sent.  If no such port already 
+        #               exists, creates a new virtual MIDI port.
+        # clock         if provided is the clock (see module 'clocks') used to time
+        #               output to this port;  defaults to real time.
+        #
+        # Only one of these port values may be provided.
+        self.clock          = clock or DEFAULT_CLOCK
+        self.midiout        = None
+        self.midi_port_num  = None
+        self.midi_port_name = None
+        self.midi_open()
+        self.print_port_info()
+        if port_number is not None:
+            self.midi_port_num  = port_number
+            self.midi_port_name = self.get_port_name(port_number)
+        elif port_name is not None:
+            midi_port = self.get_port_num(port_name)
+            if midi_port is not None:
+                self.midi_port_num  = midi_port
+                self.midi_port_name = port_name
+            else:
+                self.midi_port_name = port_name
+        if self.midi_port_num is not None:
+            print(f"MidiOut: Using MIDI port {self.midi_port_num:02d} ({self.midi_port_name:s})")
+            self.midiout.open_port(self.midi_port_num, self.midi_port_name)
+        elif self.midi_port_name is not None:
+            print(f"MidiOut: Creating virtual MIDI port {self.midi_port_name:s}")
+            self.midiout.open_virtual_port(self.midi_port_name)
+        else:
+            print(f"MidiOut: No available MIDI port specified")
+        return
+
+    def send(self, message):
+        """
+        Send Midi message to port.
+
+        NOTE: it not clear that rtmidi supports "running status"
+        (https://cmtext.indiana.edu/MIDI/chapter3_channel_voice_messages.php).
+        But the rtmidi2 Python library appears to have methods that could utilize this.
+        """
+        #print(f"send: {message}")
+        if isinstance(message[0],list):
+            for m in message:
+                self.send(m)
+        else:
+            self.midiout.send_message(message)
+        return
+
+# -----------------------
+# LoopbackMidiOut class
+# -----------------------
+
+class LoopbackMidiOut:
+    """
+    MIDI output that records each message sent with the time it was sent.
+
+    sent        is a list of (time, message) pairs, in order sent
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        self.sent  = []
+        return
+
+    def send(self, message):
+        # Record Midi message (or list of messages) with current clock time
+        if isinstance(message[0],list):
+            for m in message:
+                self.send(m)
+        else:
+            self.sent.append((self.clock.now(), list(message)))
+        return
+
+    def messages(self):
+        # Returns list of messages sent, without times
+        return [m for _, m in self.sent]
+
+# ---- Test ----
+if __name__ == "__main__":
+    lo = LoopbackMidiOut()
+    lo.send(MidiMessage.note_on(1, Note.C4))
+    lo.clock.sleep(0.5)
+    lo.send([MidiMessage.note_off(1, Note.C4), MidiMessage.note_on(1, Note.D4)])
+    assertEq(lo.sent, [(0.0, [0x90, 60, 64]), (0.5, [0x80, 60, 64]), (0.5, [0x90, 62, 64])])
+    # Port selection, with a stub in place of rtmidi that records the port opened
+    import sys
+    import types
+    class StubRtMidiOut:
+        def get_ports(self):
+            return ["iPad Bluetooth", "IAC Driver Bus 1"]
+        def open_port(self, num, name):
+            self.opened = ("port", num, name)
+        def open_virtual_port(self, name):
+            self.opened = ("virtual", name)
+    saved = sys.modules.get("rtmidi")
+    sys.modules["rtmidi"] = types.SimpleNamespace(MidiOut=StubRtMidiOut)
+    try:
+        assertEq(MidiOut(port_name="iPad").midiout.opened, ("port", 0, "iPad"))
+        assertEq(MidiOut(port_name="IAC").midiout.opened,  ("port", 1, "IAC"))
+        assertEq(MidiOut(port_number=0).midiout.opened,    ("port", 0, "iPad Bluetooth"))
+        assertEq(MidiOut(port_name="Doodle").midiout.opened, ("virtual", "Doodle"))
+    finally:
+        if saved is None:
+            del sys.modules["rtmidi"]
+        else:
+            sys.modules["rtmidi"] = saved
+# ----
+
+# End.
@@ -552,11 +552,145 @@ class MidiMessage:
         # channel   MIDI channel number 1-16
         # banknum   Bank number (1-128) @@@is this correct??@@@
         #
-        # TODO (if needed): split out bank number into MSB and LSB and assemble two controller messages
+        # Sends bank select LSB only:  see 'bank_select' for full MSB+LSB bank numbers.
         #
         # See: https://cmtext.indiana.edu/MIDI/chapter3_controller_change2.php
         return[0xB0+channel-1, 32, banknum-1]
 
+    # Controller numbers
+    #
+    # Controllers 0-31 are the MSB of a 14-bit value whose LSB is controller+32.
+    #
+    # See: https://www.midi.org/specifications-old/item/table-3-control-change-messages-data-bytes-2
+
+    CC_BANK_SELECT      = 0
+    CC_MODULATION       = 1
+    CC_DATA_ENTRY       = 6
+    CC_VOLUME           = 7
+    CC_PAN              = 10
+    CC_EXPRESSION       = 11
+    CC_LSB_OFFSET       = 32
+    CC_DATA_INCREMENT   = 96
+    CC_DATA_DECREMENT   = 97
+    CC_NRPN_LSB         = 98
+    CC_NRPN_MSB         = 99
+    CC_RPN_LSB          = 100
+    CC_RPN_MSB          = 101
+    CC_RESET_ALL        = 121
+
+    # Registered parameter numbers
+    RPN_PITCH_BEND_RANGE = 0x0000
+    RPN_FINE_TUNING      = 0x0001
+    RPN_COARSE_TUNING    = 0x0002
+    RPN_NULL             = 0x3FFF
+
+    @staticmethod
+    def control_change(channel, controller, value):
+        # channel       MIDI channel number 1-16
+        # controller    Controller number 0-127
+        # value         Controller value 0-127
+        #
+        # See: https://cmtext.indiana.edu/MIDI/chapter3_controller_change.php
+        return [0xB0+channel-1, controller, value]
+
+    @staticmethod
+    def control_change_14bit(channel, controller, value):
+        # channel       MIDI channel number 1-16
+        # controller    Controller number 0-31 (MSB);  LSB is sent on controller+32
+        # value         Controller value 0-16383
+        #
+        # Returns list of two messages: MSB then LSB
+        return [ MidiMessage.control_change(channel, controller, value >> 7)
+               , MidiMessage.control_change(channel, controller+MidiMessage.CC_LSB_OFFSET, value & 0x7F)
+               ]
+
+    @staticmethod
+    def bank_select(channel, banknum):
+        # channel   MIDI channel number 1-16
+        # banknum   Bank number 0-16383, sent as MSB (controller 0) and LSB (controller 32)
+        #
+        # Returns list of two messages.  The new bank takes effect on the next program change.
+        return MidiMessage.control_change_14bit(channel, MidiMessage.CC_BANK_SELECT, banknum)
+
+    @staticmethod
+    def parameter_number(channel, param, value, registered=True):
+        # channel       MIDI channel number 1-16
+        # param         RPN or NRPN parameter number 0-16383
+        # value         Parameter value 0-16383
+        # registered    True for a registered (RPN), False for non-registered (NRPN) parameter
+        #
+        # Returns list of four messages: parameter MSB and LSB, data entry MSB and LSB
+        if registered:
+            msb, lsb = MidiMessage.CC_RPN_MSB, MidiMessage.CC_RPN_LSB
+        else:
+            msb, lsb = MidiMessage.CC_NRPN_MSB, MidiMessage.CC_NRPN_LSB
+        return ( [ MidiMessage.control_change(channel, msb, param >> 7)
+                 , MidiMessage.control_change(channel, lsb, param & 0x7F)
+                 ] +
+                 MidiMessage.control_change_14bit(channel, MidiMessage.CC_DATA_ENTRY, value) )
+
+    @staticmethod
+    def pitch_bend(channel, value):
+        # channel   MIDI channel number 1-16
+        # value     14-bit pitch bend value 0-16383, where 8192 is no bend
+        #
+        # See: https://cmtext.indiana.edu/MIDI/chapter3_pitch_bend.php
+        return [0xE0+channel-1, value & 0x7F, value >> 7]
+
+    # System real time and common messages
+    #
+    # See: https://cmtext.indiana.edu/MIDI/chapter3_system_messages.php
+
+    @staticmethod
+    def timing_clock():
+        # Sent 24 times per quarter note to synchronize tempo
+        return [0xF8]
+
+    @staticmethod
+    def start():
+        # Start playback from the beginning of the sequence
+        return [0xFA]
+
+    @staticmethod
+    def continue_():
+        # Resume playback from the current song position
+        return [0xFB]
+
+    @staticmethod
+    def stop():
+        return [0xFC]
+
+    @staticmethod
+    def song_position(position):
+        # position  Song position in MIDI beats (16th notes) from the start, 0-16383
+        return [0xF2, position & 0x7F, position >> 7]
+
+    @staticmethod
+    def mtc_quarter_frame(piece, value):
+        # MIDI Time Code quarter frame message
+        #
+        # piece     which part of the time code is sent (0-7)
+        # value     4-bit value of that part
+        return [0xF1, (piece << 4) | value]
+
+    # System exclusive messages
+
+    SYSEX_START = 0xF0
+    SYSEX_END   = 0xF7
+
+    @staticmethod
+    def sysex(manufacturer, data):
+        # System exclusive message.
+        #
+        # manufacturer  Manufacturer ID, as a sequence of 1 or 3 byte values
+        #               (0x7D is reserved for non-commercial use)
+        # data          Message data bytes (each 0-127)
+        #
+        # For large payloads, see module 'sysex', which streams from a file.
+        #
+        # See: https://www.midi.org/specifications-old/item/table-4-universal-system-exclusive-messages
+        return [MidiMessage.SYSEX_START, *manufacturer, *data, MidiMessage.SYSEX_END]
+
 
 
 
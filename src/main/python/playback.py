@@ -0,0 +1,139 @@
+# playback.py
+#
+# Playback routines:  scales, chords and arpeggios played to a MIDI output.
+#
+# Each routine takes an output object (such as midiout.MidiOut or
+# midiout.LoopbackMidiOut) and waits on the output's clock between messages,
+# so the same routine plays a device in real time or records to a loopback
+# output in simulated time.  No MIDI backend is imported here.
+#
+# 'PIECES' maps a name for each routine to the routine, for use by callers
+# such as the command line interface in 'midicli.py'.
+#
+
+import itertools
+
+from midiutils import assertEq, Note, Chord, KeySignature, Patch, Patches, MidiMessage
+from clocks import VirtualClock
+from midiout import LoopbackMidiOut
+
+SCALE_NOTES = (
+    Note.C3, Note.D3, Note.E3, Note.F3, Note.G3, Note.A3, Note.B3,
+    Note.C4, Note.D4, Note.E4, Note.F4, Note.G4, Note.A4, Note.B4,
+    Note.C5,
+    )
+
+CMAJ_CHORDS = (
+    Chord(Note.C4, Note.E4, Note.G4),
+    Chord(Note.F4, Note.A4, Note.C5),
+    Chord(Note.G4, Note.B4, Note.D5),
+    Chord(Note.F4, Note.A4, Note.C5),
+    Chord(Note.C4, Note.E4, Note.G4)
+    )
+
+def _log(verbose, text):
+    if verbose:
+        print(text)
+    return
+
+def play_scales(midiout, channel=1, verbose=True):
+    # Play a two-octave C major scale with each General MIDI instrument in turn
+    clock = midiout.clock
+    for p in Patches():
+        _log(verbose, f"program_change: {p}")
+        midiout.send(MidiMessage.program_change(channel, p))
+        for note in SCALE_NOTES:
+            _log(verbose, f"Play note {note}")
+            midiout.send(MidiMessage.note_on(channel, note))
+            clock.sleep(0.25)
+            midiout.send(MidiMessage.note_off(channel, note))
+            clock.sleep(0.05)
+    return
+
+def play_Cmaj_chords(midiout, channel=1, patch=Patch.GRAND_PIANO, verbose=True):
+    # Play a I-IV-V-IV-I chord sequence in C major, four times
+    clock = midiout.clock
+    midiout.send(MidiMessage.program_change(channel, patch))
+    for _ in range(4):
+        for c in CMAJ_CHORDS:
+            _log(verbose, f"Play chord {c}")
+            midiout.send(MidiMessage.chord_on(channel, c))
+            clock.sleep(0.5)
+            midiout.send(MidiMessage.chord_off(channel, c))
+            clock.sleep(0.05)
+    return
+
+def play_Cmaj_arpeggios(midiout, channel1=1, channel2=2,
+        patch1=Patch.REED_ORGAN, patch2=Patch.ORCHESTRAL_HARP, verbose=True):
+    # Play the C major chord sequence as arpeggios on channel1, each over the
+    # held chord on channel2, twice
+    clock = midiout.clock
+    midiout.send(MidiMessage.program_change(channel1, patch1))
+    midiout.send(MidiMessage.program_change(channel2, patch2))
+    for _ in range(2):
+        for c in CMAJ_CHORDS:
+            _log(verbose, f"Play arpeggio {c}")
+            midiout.send(MidiMessage.chord_on(channel2, c))
+            for n in c:
+                midiout.send(MidiMessage.note_on(channel1, n))
+                clock.sleep(0.35)
+                midiout.send(MidiMessage.note_off(channel1, n))
+            for n in list(reversed(c))[1:]:
+                midiout.send(MidiMessage.note_on(channel1, n))
+                clock.sleep(0.35)
+                midiout.send(MidiMessage.note_off(channel1, n))
+            midiout.send(MidiMessage.chord_off(channel2, c))
+            clock.sleep(0.35)
+    return
+
+def play_keysig_scales(midiout, channel=1, patch=Patch.GRAND_PIANO, keys=None, verbose=True):
+    # Play an octave scale up and down in each key signature
+    #
+    # keys          if provided is a list of key names (e.g. 'C_maj', 'Bb_min');
+    #               defaults to all keys
+    clock = midiout.clock
+    midiout.send(MidiMessage.program_change(channel, patch))
+    keysigs = [KeySignature.get_key(k) for k in (keys or KeySignature.iter_keys())]
+    for keysig in keysigs:
+        _log(verbose, f"Play {keysig} scale")
+        notes = list(itertools.chain(keysig.iter_octave(4), [keysig.get_note(5,1)]))
+        for note in notes + list(reversed(notes[:-1])):
+            _log(verbose, f"Play note {note}")
+            midiout.send(MidiMessage.note_on(channel, note))
+            clock.sleep(0.25)
+            midiout.send(MidiMessage.note_off(channel, note))
+            clock.sleep(0.1)
+    return
+
+PIECES = {
+    'scales':           play_scales,
+    'chords':           play_Cmaj_chords,
+    'arpeggios':        play_Cmaj_arpeggios,
+    'keysig-scales':    play_keysig_scales,
+    }
+
+def record(piece, **kwargs):
+    """
+    Play a routine to a loopback output in simulated time, and return the
+    (seconds, message) pairs it sent.
+
+    piece       is a playback routine, or the name of one in PIECES
+    """
+    if isinstance(piece, str):
+        piece = PIECES[piece]
+    midiout = LoopbackMidiOut(VirtualClock())
+    piece(midiout, verbose=False, **kwargs)
+    return midiout.sent
+
+# ---- Test ----
+if __name__ == "__main__":
+    sent = record('chords')
+    assertEq(len(sent), 1 + 4*5*6)
+    assertEq(sent[0], (0.0, MidiMessage.program_change(1, Patch.GRAND_PIANO)))
+    sent = record(play_keysig_scales, keys=['C_maj'])
+    assertEq([m[1] for _, m in sent[1::2]],
+        [48, 50, 52, 53, 55, 57, 59, 60, 59, 57, 55, 53, 52, 50, 48])
+    assertEq(round(sent[-1][0], 6), 15*0.35 - 0.1)
+# ----
+
+# End.
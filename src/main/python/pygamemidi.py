@@ -0,0 +1,271 @@
+# pygamemidi.py
+#
+# MIDI output via pygame.midi (PortMidi), using timestamped buffered writes.
+#
+# Opening a PortMidi output with latency=0 disables its timestamp handling, so
+# every message goes out the moment it is written and the caller has to time
+# notes with time.sleep.  Opened with a non-zero latency, PortMidi holds each
+# message until its timestamp (plus the latency) comes round, so a whole block
+# of events can be handed over ahead of time and the driver-side scheduler does
+# the timing.
+#
+# Messages are the byte lists produced by midiutils.MidiMessage.  PortMidi
+# writes short messages (at most 3 bytes) and SysEx messages by different
+# calls, so SysEx is sent with 'write_sys_ex' and the rest with 'write' or
+# 'write_short'.
+#
+# See: https://www.pygame.org/docs/ref/midi.html#pygame.midi.Output
+#
+
+import time
+import statistics
+
+import pygame
+import pygame.midi
+
+from midiutils import Note, MidiMessage
+from streaming import read_ahead, DEFAULT_WINDOW
+
+# Milliseconds that PortMidi holds messages before their timestamps fall due.
+# Timestamps that are already in the past when written are sent immediately.
+DEFAULT_LATENCY = 20
+
+# Lead time (ms) between writing a block and the first event in it
+DEFAULT_LEAD = 50
+
+# Maximum number of events accepted by one call to pygame.midi.Output.write
+WRITE_BLOCK_SIZE = 1024
+
+# --------------------
+# PygameMidiOut class
+# --------------------
+
+class PygameMidiOut:
+    """
+    Sends MidiMessage byte lists to a pygame.midi output, either immediately
+    (send) or as blocks of events timestamped in advance (write_events, schedule).
+    """
+
+    def __init__(self, device_id=None, latency=DEFAULT_LATENCY, buffer_size=4096):
+        """
+        Open a pygame.midi output.
+
+        device_id   if provided is the PortMidi device number to which MIDI data will
+                    be sent;  otherwise the default output device is used.
+        latency     is the PortMidi latency in milliseconds.  Must be greater than 0
+                    for event timestamps to be honoured.
+        buffer_size is the number of events PortMidi can hold pending output.
+        """
+        if latency <= 0:
+            raise ValueError("PygameMidiOut: latency must be > 0 for timestamped output")
+        pygame.midi.init()
+        if device_id is None:
+            device_id = pygame.midi.get_default_output_id()
+        self.device_id = device_id
+        self.latency   = latency
+        self.midiout   = pygame.midi.Output(device_id, latency=latency, buffer_size=buffer_size)
+        return
+
+    def close(self):
+        if self.midiout:
+            self.midiout.close()
+            self.midiout = None
+        return
+
+    def time(self):
+        # Returns the current PortMidi time in milliseconds, as used for timestamps
+        return pygame.midi.time()
+
+    def send(self, message):
+        """
+        Send Midi message (or list of messages) to the port immediately.
+        """
+        if isinstance(message[0],list):
+            for m in message:
+                self.send(m)
+        elif message[0] == MidiMessage.SYSEX_START:
+            self.midiout.write_sys_ex(self.time(), message)
+        else:
+            self.midiout.write_short(*message)
+        return
+
+    def write_events(self, events):
+        """
+        Hand a block of timestamped events to PortMidi for scheduled output.
+
+        events      is a sequence of (timestamp, message) pairs, where timestamp is
+                    an absolute PortMidi time in milliseconds (see 'time') and
+                    message is a MidiMessage byte list.  Events should be in
+                    timestamp order.  SysEx messages are written singly, after
+                    the events before them, as PortMidi cannot block them.
+
+        Returns the number of events written.
+        """
+        block = []
+        count = 0
+        for timestamp, message in events:
+            if message[0] == MidiMessage.SYSEX_START:
+                if block:
+                    self.midiout.write(block)
+                    count += len(block)
+                    block  = []
+                self.midiout.write_sys_ex(int(timestamp), message)
+                count += 1
+                continue
+            block.append([message, int(timestamp)])
+            if len(block) == WRITE_BLOCK_SIZE:
+                self.midiout.write(block)
+                count += len(block)
+                block  = []
+        if block:
+            self.midiout.write(block)
+            count += len(block)
+        return count
+
+    def schedule(self, events, start=None, lead=DEFAULT_LEAD):
+        """
+        Schedule a sequence of events given at relative times.
+
+        events      is a sequence of (seconds, message) pairs, with times measured
+                    from the start of the sequence.
+        start       if provided is the PortMidi time (ms) at which the sequence starts;
+                    otherwise it starts 'lead' milliseconds from now.
+
+        Returns the PortMidi time (ms) of the start of the sequence.
+        """
+        if start is None:
+            start = self.time() + lead
+        self.write_events((start + secs*1000, message) for secs, message in events)
+        return start
+
+    def stream(self, events, window=DEFAULT_WINDOW, lead=DEFAULT_LEAD):
+        """
+        Play a sequence of events at relative times, handing them to PortMidi
+        in blocks no more than 'window' seconds ahead of when they fall due.
+
+        events      is an iterable of (seconds, message) pairs in time order.  It
+                    may be a generator (such as streaming.timed_events), which is
+                    consumed only as playback proceeds, so memory use does not
+                    depend on the length of the piece.  The PortMidi buffer
+                    ('buffer_size') must hold the events of one window.
+
+        Returns the PortMidi time (ms) of the start of the sequence, once the
+        last event has been handed over and fallen due.
+        """
+        start    = self.time() + lead
+        position = lambda: (self.time() - start)/1000
+        block    = []
+        last     = 0.0
+        for secs, message in read_ahead(events, position, window):
+            ahead = secs - window - position()
+            if ahead > 0 or len(block) == WRITE_BLOCK_SIZE:
+                self.write_events(block)
+                block = []
+                if ahead > 0:
+                    # Wait until half the window is free, so blocks stay large
+                    time.sleep(ahead + window/2)
+            block.append((start + secs*1000, message))
+            last = secs
+        self.write_events(block)
+        delay = last - position()
+        if delay > 0:
+            time.sleep(delay)
+        return start
+
+# ---- Sequence helpers ----
+
+def note_sequence(channel, notes, note_time, gap_time, velocity=64, start=0.0):
+    """
+    Returns a list of (seconds, message) events that play the supplied notes in
+    turn, each for 'note_time' seconds followed by 'gap_time' seconds of silence.
+    """
+    events = []
+    t = start
+    for note in notes:
+        events.append((t,           MidiMessage.note_on(channel, note, velocity)))
+        events.append((t+note_time, MidiMessage.note_off(channel, note, velocity)))
+        t += note_time + gap_time
+    return events
+
+def play_sleep_loop(midiout, events):
+    """
+    Play (seconds, message) events by sleeping until each is due, then sending it.
+
+    This is the timing method used before timestamped output was available, and
+    is retained to measure against.  Returns the list of send times in seconds
+    relative to the start.
+    """
+    sent = []
+    t0   = time.perf_counter()
+    for secs, message in events:
+        delay = secs - (time.perf_counter()-t0)
+        if delay > 0:
+            time.sleep(delay)
+        midiout.send(message)
+        sent.append(time.perf_counter()-t0)
+    return sent
+
+def timing_errors(expected, observed):
+    # Returns list of timing errors (ms) after aligning both sequences at their first event
+    return [ ((o-observed[0]) - (e-expected[0]))*1000 for e, o in zip(expected, observed) ]
+
+def jitter_summary(errors):
+    # Returns a dictionary summarising a list of timing errors (ms)
+    abserrs = [abs(e) for e in errors]
+    return {
+        'count':  len(errors),
+        'mean':   statistics.fmean(errors),
+        'stdev':  statistics.pstdev(errors),
+        'max':    max(abserrs),
+        }
+
+def measure_jitter(output_id, input_id, events, latency=DEFAULT_LATENCY):
+    """
+    Compare timing jitter of the sleep loop against timestamped buffered output.
+
+    output_id   is the PortMidi output device
+    input_id    is a PortMidi input device looped back from the output (e.g. an
+                IAC bus on MacOS, or a physical cable from MIDI out to MIDI in).
+                Arrival timestamps on this input are taken by PortMidi in the
+                driver, so they reflect when messages actually left the output.
+    events      is a sequence of (seconds, message) events to play.
+
+    Returns a dictionary with a jitter summary for each method, in milliseconds.
+    """
+    expected = [secs for secs, _ in events]
+    midiout  = PygameMidiOut(output_id, latency=latency)
+    midiin   = pygame.midi.Input(input_id)
+    results  = {}
+    try:
+        for method in ("sleep", "timestamped"):
+            while midiin.poll():
+                midiin.read(WRITE_BLOCK_SIZE)
+            if method == "sleep":
+                play_sleep_loop(midiout, events)
+            else:
+                start = midiout.schedule(events)
+                while midiout.time() < start + expected[-1]*1000 + latency*2:
+                    time.sleep(0.01)
+            arrivals = []
+            time.sleep(latency*2/1000)
+            while midiin.poll():
+                arrivals.extend(ts/1000 for _, ts in midiin.read(WRITE_BLOCK_SIZE))
+            results[method] = jitter_summary(timing_errors(expected, arrivals))
+    finally:
+        midiin.close()
+        midiout.close()
+    return results
+
+# ---- Test ----
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python pygamemidi.py <output_id> <loopback_input_id>")
+        sys.exit(1)
+    events = note_sequence(1, [Note.C4, Note.D4, Note.E4, Note.F4, Note.G4]*8, 0.1, 0.025)
+    for method, summary in measure_jitter(int(sys.argv[1]), int(sys.argv[2]), events).items():
+        print(f"{method:12s}: "+", ".join(f"{k} {v:.3f}" for k, v in summary.items()))
+    pygame.midi.quit()
+# ----
+
+# End.
@@ -0,0 +1,99 @@
+# scheduler.py
+#
+# Timed playback of event sequences to a MIDI output.
+#
+# Defines class 'Scheduler', which sends (time, message) events to an output at
+# their due times, waiting on the output's clock.  The scheduler's timeline
+# starts at 'origin' (a clock time), and may be measured in seconds or, with a
+# TempoMap, in ticks.  Other timing sources (such as MIDI clock generation)
+# lock to the same timeline through 'timeline_to_clock'.
+#
+
+from midiutils import assertEq, Note, MidiMessage
+from clocks import VirtualClock
+from midiout import LoopbackMidiOut
+
+# ---------------
+# Scheduler class
+# ---------------
+
+class Scheduler:
+    """
+    Sends time-ordered events to a MIDI output, using the output's clock.
+    """
+
+    def __init__(self, midiout, tempomap=None, clock=None):
+        """
+        Create a Scheduler object.
+
+        midiout     is the output to which events are sent
+        tempomap    if provided is a TempoMap, and event times are in ticks;
+                    otherwise event times are in seconds
+        clock       is the clock used for timing;  defaults to the output's clock
+        """
+        self.midiout  = midiout
+        self.tempomap = tempomap
+        self.clock    = clock or midiout.clock
+        self.origin   = None
+        self.sent     = 0
+        return
+
+    def start(self, origin=None):
+        # Set the clock time of timeline position 0 (default now)
+        self.origin = self.clock.now() if origin is None else origin
+        return self.origin
+
+    def timeline_to_clock(self, t):
+        # Returns the clock time of timeline position 't' (seconds or ticks)
+        if self.tempomap:
+            t = self.tempomap.tick_to_seconds(t)
+        return self.origin + t
+
+    def position(self):
+        # Returns the current timeline position (seconds, or fractional ticks)
+        secs = self.clock.now() - self.origin
+        if self.tempomap:
+            return self.tempomap.seconds_to_tick(secs)
+        return secs
+
+    def play(self, events):
+        """
+        Send events at their due times.
+
+        events      is an iterable of (time, message) pairs in time order.  It may be
+                    a generator:  events are consumed only as they fall due.
+
+        Starts the timeline now if it has not already been started.
+        """
+        if self.origin is None:
+            self.start()
+        clock = self.clock
+        send  = self.midiout.send
+        for t, message in events:
+            clock.sleep_until(self.timeline_to_clock(t))
+            send(message)
+            self.sent += 1
+        return
+
+# ---- Test ----
+if __name__ == "__main__":
+    from tempomap import TempoMap
+    out = LoopbackMidiOut(VirtualClock(10.0))
+    s   = Scheduler(out)
+    s.play([ (0.0, MidiMessage.note_on(1, Note.C4))
+           , (0.5, MidiMessage.note_off(1, Note.C4))
+           , (0.5, MidiMessage.note_on(1, Note.E4))
+           , (1.0, MidiMessage.note_off(1, Note.E4))
+           ])
+    assertEq([t for t, _ in out.sent], [10.0, 10.5, 10.5, 11.0])
+    assertEq(s.position(), 1.0)
+    tm = TempoMap(ppq=480)
+    tm.add_tempo_bpm(960, 60)
+    out = LoopbackMidiOut()
+    s   = Scheduler(out, tempomap=tm)
+    s.play((t, MidiMessage.note_on(1, Note.C4)) for t in (0, 480, 960, 1440))
+    assertEq([t for t, _ in out.sent], [0.0, 0.5, 1.0, 2.0])
+    assertEq(s.position(), 1440.0)
+# ----
+
+# End.
@@ -0,0 +1,318 @@
+# smf.py
+#
+# Standard MIDI File (SMF) reading and writing, one event at a time.
+#
+# Defines:
+#
+#   'SMFReader'     reads the file header and the position of each track, then
+#                   decodes any track lazily as a generator of (tick, message)
+#                   pairs.  Each track generator reads through its own small
+#                   buffer, so memory use does not depend on the file size.
+#   'SMFWriter'     writes tracks from iterables of (tick, message) pairs,
+#                   without holding a whole track in memory.
+#
+# Messages are byte lists as produced by MidiMessage.  Meta events appear as
+# [0xFF, type, data...] and SysEx events as [0xF0, data..., 0xF7].  A SysEx
+# message divided into packets (an F0 event without a final F7, continued by
+# F7 events) is reassembled and returned whole at the tick of its last packet.
+# Other F7 'escape' events are returned as the raw bytes they contain.
+#
+# See: https://www.music.mcgill.ca/~ich/classes/mumt306/StandardMIDIfileformat.html
+#
+
+import struct
+
+from midiutils import assertEq, Note, Patch, MidiMessage
+
+META            = 0xFF
+META_END_TRACK  = 0x2F
+META_TEMPO      = 0x51
+META_TIMESIG    = 0x58
+
+# Bytes read from the file at a time by each track decoder
+READ_BLOCK_SIZE = 65536
+
+# Data byte count for each channel message status (high nibble)
+CHANNEL_DATA_BYTES = { 0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2 }
+
+def encode_varlen(value):
+    # Returns bytes of a variable-length quantity
+    result = [value & 0x7F]
+    value >>= 7
+    while value:
+        result.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(result))
+
+def tempo_message(tempo):
+    # Returns set tempo meta event for tempo in microseconds per quarter note
+    return [META, META_TEMPO, (tempo >> 16) & 0xFF, (tempo >> 8) & 0xFF, tempo & 0xFF]
+
+def message_tempo(message):
+    # Returns tempo from a set tempo meta event
+    return (message[2] << 16) | (message[3] << 8) | message[4]
+
+# -----------------
+# SMFReader class
+# -----------------
+
+class SMFReader:
+    """
+    Lazily decodes the tracks of a Standard MIDI File.
+    """
+
+    def __init__(self, path, strict=False):
+        """
+        Create an SMFReader object.
+
+        path        is the name of the file
+        strict      if True, meta and SysEx events cancel running status, as the
+                    SMF spec requires.  By default running status is kept across
+                    them, as many sequencers write files that rely on this, and
+                    a data byte is rejected only if no channel status precedes it.
+        """
+        self.path   = path
+        self.strict = strict
+        self.tracks = []                # (offset, length) of each track's data
+        with open(path, "rb") as f:
+            chunk, length = struct.unpack(">4sL", f.read(8))
+            if chunk != b"MThd":
+                raise ValueError(f"SMFReader: {path} is not a Standard MIDI File")
+            self.format, ntracks, self.division = struct.unpack(">HHH", f.read(6))
+            if self.division & 0x8000:
+                raise ValueError(f"SMFReader: SMPTE time division is not supported")
+            f.seek(8+length)
+            while len(self.tracks) < ntracks:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                chunk, length = struct.unpack(">4sL", header)
+                if chunk == b"MTrk":
+                    self.tracks.append((f.tell(), length))
+                f.seek(length, 1)
+        return
+
+    @property
+    def ppq(self):
+        return self.division
+
+    def iter_track(self, tracknum):
+        """
+        Generator of (tick, message) pairs for one track, in order, decoded as
+        they are requested.  The end of track meta event is not included.
+        """
+        offset, length = self.tracks[tracknum]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            remaining = length
+            buf  = b""
+            pos  = 0
+            tick = 0
+            running = 0
+            sysex   = None      # Data of divided SysEx message awaiting continuation
+            while True:
+                # Make sure the longest event header (delta, status, meta type and
+                # length) or channel message is buffered
+                if len(buf)-pos < 16 and remaining:
+                    block = f.read(min(READ_BLOCK_SIZE, remaining))
+                    remaining -= len(block)
+                    buf = buf[pos:] + block
+                    pos = 0
+                if pos >= len(buf):
+                    return
+                delta = 0
+                while True:
+                    b = buf[pos]
+                    pos += 1
+                    delta = (delta << 7) | (b & 0x7F)
+                    if b < 0x80:
+                        break
+                tick += delta
+                status = buf[pos]
+                if status < 0x80:
+                    if not running:
+                        raise ValueError(f"SMFReader: data byte without running status in track {tracknum}")
+                    status = running
+                else:
+                    pos += 1
+                if status < 0xF0:
+                    running = status
+                    n = CHANNEL_DATA_BYTES[status & 0xF0]
+                    yield (tick, [status, *buf[pos:pos+n]])
+                    pos += n
+                    continue
+                # Meta and SysEx events cancel running status, if strict
+                if self.strict:
+                    running = 0
+                if status == META:
+                    kind = buf[pos]
+                    pos += 1
+                # Meta or SysEx:  variable-length data, which may exceed the buffer
+                size = 0
+                while True:
+                    b = buf[pos]
+                    pos += 1
+                    size = (size << 7) | (b & 0x7F)
+                    if b < 0x80:
+                        break
+                if len(buf)-pos < size:
+                    block = f.read(size-(len(buf)-pos))
+                    remaining -= len(block)
+                    buf = buf[pos:] + block
+                    pos = 0
+                data = buf[pos:pos+size]
+                pos += size
+                if status == META:
+                    if kind == META_END_TRACK:
+                        return
+                    yield (tick, [META, kind, *data])
+                    continue
+                if status == MidiMessage.SYSEX_START:
+                    sysex = [status, *data]
+                elif sysex is not None:
+                    sysex.extend(data)
+                elif data:
+                    # Escape sequence:  bytes to be sent as they are
+                    yield (tick, list(data))
+                    continue
+                else:
+                    continue
+                if sysex[-1] == MidiMessage.SYSEX_END:
+                    yield (tick, sysex)
+                    sysex = None
+        return
+
+# -----------------
+# SMFWriter class
+# -----------------
+
+class SMFWriter:
+    """
+    Writes a Standard MIDI File one track at a time.
+
+    Use as a context manager, or call 'close' when done.  The track count in the
+    header is filled in on closing.
+    """
+
+    def __init__(self, path, ppq=480, format=1):
+        self.file    = open(path, "wb")
+        self.ntracks = 0
+        self.file.write(struct.pack(">4sLHHH", b"MThd", 6, format, 0, ppq))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self.file:
+            self.file.seek(10)
+            self.file.write(struct.pack(">H", self.ntracks))
+            self.file.close()
+            self.file = None
+        return
+
+    def write_track(self, events):
+        """
+        Write a track from an iterable of (tick, message) pairs in tick order.
+        Returns the number of events written.
+        """
+        f     = self.file
+        start = f.tell()
+        f.write(b"MTrk\0\0\0\0")
+        write = f.write
+        last  = 0
+        count = 0
+        for tick, message in events:
+            write(encode_varlen(tick-last))
+            last = tick
+            if message[0] == META:
+                write(bytes(message[:2]) + encode_varlen(len(message)-2) + bytes(message[2:]))
+            elif message[0] == MidiMessage.SYSEX_START:
+                write(b"\xF0" + encode_varlen(len(message)-1) + bytes(message[1:]))
+            else:
+                write(bytes(message))
+            count += 1
+        write(b"\0\xFF\x2F\0")
+        end = f.tell()
+        f.seek(start+4)
+        f.write(struct.pack(">L", end-start-8))
+        f.seek(end)
+        self.ntracks += 1
+        return count
+
+# ---- Test ----
+if __name__ == "__main__":
+    import os
+    import tempfile
+    assertEq(encode_varlen(0),         b"\x00")
+    assertEq(encode_varlen(0x7F),      b"\x7F")
+    assertEq(encode_varlen(0x80),      b"\x81\x00")
+    assertEq(encode_varlen(0x0FFFFFFF), b"\xFF\xFF\xFF\x7F")
+    track0 = [ (0, tempo_message(500000)), (960, tempo_message(1000000)) ]
+    track1 = [ (0,   MidiMessage.program_change(1, Patch.CELLO))
+             , (0,   MidiMessage.note_on(1, Note.C4))
+             , (480, MidiMessage.note_off(1, Note.C4))
+             , (480, MidiMessage.sysex([0x7D], [i % 128 for i in range(300)]))
+             , (960, MidiMessage.pitch_bend(1, 9000))
+             ]
+    fd, path = tempfile.mkstemp(suffix=".mid")
+    os.close(fd)
+    try:
+        with SMFWriter(path, ppq=480) as w:
+            w.write_track(track0)
+            w.write_track(track1)
+        r = SMFReader(path)
+        assertEq((r.format, len(r.tracks), r.ppq), (1, 2, 480))
+        assertEq(list(r.iter_track(0)), track0)
+        assertEq(list(r.iter_track(1)), track1)
+        assertEq(message_tempo(track0[1][1]), 1000000)
+        # Running status, as written by other software
+        with open(path, "wb") as f:
+            data = b"\x00\x90\x3C\x40\x60\x3E\x40\x00\x80\x3C\x40\x00\xFF\x2F\x00"
+            f.write(struct.pack(">4sLHHH", b"MThd", 6, 0, 1, 96))
+            f.write(struct.pack(">4sL", b"MTrk", len(data)) + data)
+        assertEq(list(SMFReader(path).iter_track(0)),
+            [(0, [0x90, 60, 64]), (96, [0x90, 62, 64]), (96, [0x80, 60, 64])])
+        # A SysEx message in packets is reassembled, and an escape event gives
+        # its raw bytes
+        with open(path, "wb") as f:
+            data = ( b"\x00\x90\x3C\x40"
+                     b"\x00\xF0\x03\x7D\x01\x02"      # SysEx, continued below
+                     b"\x10\xF7\x02\x03\xF7"          # continuation, ending F7
+                     b"\x00\xF7\x01\xF8"              # escape:  timing clock
+                     b"\x00\xFF\x2F\x00" )
+            f.write(struct.pack(">4sLHHH", b"MThd", 6, 0, 1, 96))
+            f.write(struct.pack(">4sL", b"MTrk", len(data)) + data)
+        assertEq(list(SMFReader(path).iter_track(0)),
+            [(0, [0x90, 60, 64]), (16, [0xF0, 0x7D, 1, 2, 3, 0xF7]), (16, [0xF8])])
+        with open(path, "wb") as f:
+            data = b"\x00\x90\x3C\x40\x00\xFF\x01\x01\x41\x00\x3C\x00\x00\xFF\x2F\x00"
+            f.write(struct.pack(">4sLHHH", b"MThd", 6, 0, 1, 96))
+            f.write(struct.pack(">4sL", b"MTrk", len(data)) + data)
+        # Running status kept across a meta event, except in strict mode
+        assertEq(list(SMFReader(path).iter_track(0)),
+            [(0, [0x90, 60, 64]), (0, [META, 0x01, 0x41]), (0, [0x90, 60, 0])])
+        try:
+            list(SMFReader(path, strict=True).iter_track(0))
+            assertEq("running status after meta event", "rejected")
+        except ValueError as e:
+            print(f"Expected: {e}")
+        # A data byte with no channel status before it is always rejected
+        with open(path, "wb") as f:
+            data = b"\x00\xFF\x01\x01\x41\x00\x3C\x00\x00\xFF\x2F\x00"
+            f.write(struct.pack(">4sLHHH", b"MThd", 6, 0, 1, 96))
+            f.write(struct.pack(">4sL", b"MTrk", len(data)) + data)
+        try:
+            list(SMFReader(path).iter_track(0))
+            assertEq("data byte without status", "rejected")
+        except ValueError as e:
+            print(f"Expected: {e}")
+    finally:
+        os.remove(path)
+# ----
+
+# End.
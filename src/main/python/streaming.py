@@ -0,0 +1,178 @@
+# streaming.py
+#
+# Streaming playback of large multi-track MIDI files.
+#
+# Playback is a pipeline of generators, so no stage holds more than a few
+# events at a time, however long the piece:
+#
+#   SMFReader.iter_track    one lazy decoder per track, yielding (tick, message)
+#   merge_tracks            k-way merge of the tracks by tick, through a heap
+#                           holding one pending event per track
+#   timed_events            converts ticks to seconds, applying tempo changes
+#                           as they are reached
+#   read_ahead              keeps a small buffer of events decoded ahead of the
+#                           play cursor, bounded in both time and count
+#   Scheduler.play          sends each event to the MidiOut when it falls due
+#
+
+from collections import deque
+import heapq
+
+from midiutils import assertEq
+from smf import SMFReader, META, META_TEMPO, message_tempo
+from tempomap import DEFAULT_TEMPO
+from scheduler import Scheduler
+
+# Default read-ahead window (seconds) and buffer size (events)
+DEFAULT_WINDOW      = 0.5
+DEFAULT_BUFFER_SIZE = 64
+
+def merge_tracks(reader):
+    """
+    Generator merging all tracks of an SMFReader into one (tick, message) stream.
+
+    Events at the same tick keep their track order, so tempo changes in the
+    first track take effect before notes at the same tick in later tracks.
+    """
+    return heapq.merge(*(reader.iter_track(i) for i in range(len(reader.tracks))),
+        key=lambda e: e[0])
+
+def timed_events(events, ppq):
+    """
+    Generator converting (tick, message) events to (seconds, message) events.
+
+    Tempo meta events are applied as they are reached, and not passed on;
+    other meta events are dropped.  Only the current tempo segment is kept,
+    so memory use does not grow with the number of tempo changes.
+    """
+    seg_tick  = 0
+    seg_secs  = 0.0
+    seg_rate  = DEFAULT_TEMPO/(ppq*1000000)      # seconds per tick
+    for tick, message in events:
+        if message[0] == META:
+            if message[1] == META_TEMPO:
+                seg_secs  += (tick-seg_tick)*seg_rate
+                seg_tick   = tick
+                seg_rate   = message_tempo(message)/(ppq*1000000)
+            continue
+        yield (seg_secs + (tick-seg_tick)*seg_rate, message)
+    return
+
+def read_ahead(events, position, window=DEFAULT_WINDOW, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Generator that buffers timed events ahead of the play cursor.
+
+    position    is a function returning the current play position in seconds
+    window      is how far ahead of the play position events may be decoded
+    buffer_size is the most events held at once
+
+    At least one event is always buffered, so the next event due is ready
+    however far ahead it lies.
+    """
+    buffer  = deque()
+    events  = iter(events)
+    pending = next(events, None)
+    while pending is not None or buffer:
+        horizon = position() + window
+        while pending is not None and len(buffer) < buffer_size and (
+                not buffer or pending[0] <= horizon):
+            buffer.append(pending)
+            pending = next(events, None)
+        yield buffer.popleft()
+    return
+
+def stream_file(path, position, window=DEFAULT_WINDOW, buffer_size=DEFAULT_BUFFER_SIZE):
+    # Returns generator of (seconds, message) events from a MIDI file, read lazily
+    reader = SMFReader(path)
+    timed  = timed_events(merge_tracks(reader), reader.ppq)
+    return read_ahead(timed, position, window, buffer_size)
+
+def play_file(path, midiout, window=DEFAULT_WINDOW, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Play a MIDI file to 'midiout', streaming it from disk.  Returns the Scheduler.
+    """
+    scheduler = Scheduler(midiout)
+    scheduler.start()
+    scheduler.play(stream_file(path, scheduler.position, window, buffer_size))
+    return scheduler
+
+# ---- Test ----
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    import time
+    import resource
+    from midiutils import Note, MidiMessage
+    from clocks import VirtualClock
+    from midiout import LoopbackMidiOut
+    from smf import SMFWriter, tempo_message
+
+    class CountingMidiOut:
+        # Output that keeps only a count and the last message time
+        def __init__(self, clock):
+            self.clock = clock
+            self.count = 0
+            self.last  = None
+            self.order = True
+        def send(self, message):
+            now = self.clock.now()
+            if self.last is not None and now < self.last:
+                self.order = False
+            self.last   = now
+            self.count += 1
+
+    def track_events(channel, notes, step):
+        # Generator of note on/off pairs, so large files are written without lists
+        tick = 0
+        for i in range(notes):
+            note = 36 + (i*7 + channel*5) % 60
+            yield (tick,        [0x90+channel-1, note, 64])
+            yield (tick+step-1, [0x80+channel-1, note, 64])
+            tick += step
+        return
+
+    def tempo_events(count, step):
+        for i in range(count):
+            yield (i*step, tempo_message(400000 + (i % 5)*50000))
+        return
+
+    # Small file:  check merged order and tempo handling exactly
+    fd, path = tempfile.mkstemp(suffix=".mid")
+    os.close(fd)
+    try:
+        with SMFWriter(path, ppq=480) as w:
+            w.write_track([(0, tempo_message(500000)), (960, tempo_message(1000000))])
+            w.write_track([(0, MidiMessage.note_on(1, Note.C4)), (1440, MidiMessage.note_off(1, Note.C4))])
+            w.write_track([(480, MidiMessage.note_on(2, Note.E4)), (960, MidiMessage.note_off(2, Note.E4))])
+        out = LoopbackMidiOut(VirtualClock())
+        play_file(path, out)
+        assertEq(out.sent,
+            [ (0.0, [0x90, 60, 64]), (0.5, [0x91, 64, 64])
+            , (1.0, [0x81, 64, 64]), (2.0, [0x80, 60, 64]) ])
+
+        # Benchmark:  memory stays flat as the input grows
+        sizes = [int(a) for a in sys.argv[1:]] or [200000, 2000000, 5000000]
+        for total in sizes:
+            tracks = 8
+            with SMFWriter(path, ppq=480) as w:
+                w.write_track(tempo_events(total//1000, 480*500//tracks))
+                for ch in range(1, tracks+1):
+                    w.write_track(track_events(ch, total//(2*tracks), 120+ch))
+            size  = os.path.getsize(path)
+            out   = CountingMidiOut(VirtualClock())
+            t0    = time.perf_counter()
+            play_file(path, out)
+            t1    = time.perf_counter()
+            assertEq(out.order, True)
+            # Peak resident size of the whole process (KB on Linux, bytes on MacOS):
+            # the same for every input size if playback memory use is flat
+            peak  = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"{out.count} events from {tracks} tracks ({size/1e6:.1f}MB file) "
+                  f"streamed in {t1-t0:.1f}s ({out.count/(t1-t0)/1e3:.0f}K events/s), "
+                  f"peak RSS {peak}")
+    finally:
+        os.remove(path)
+# ----
+
+# End.
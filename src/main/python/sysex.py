@@ -0,0 +1,326 @@
+# sysex.py
+#
+# Streaming transfer of large System Exclusive (SysEx) payloads.
+#
+# Patch banks and sample dumps are stored as .syx files:  one or more SysEx
+# messages (F0 ... F7) concatenated together.  Sending them as fast as possible
+# overruns slow links such as Bluetooth MIDI, so this module:
+#
+#   - maps the file into memory and hands out memoryview slices of it, so the
+#     payload is never copied into one big Python list;
+#   - paces messages with a bytes-per-second rate limiter (token bucket);
+#   - optionally splits each message into chunks, for outputs that accept a
+#     raw MIDI byte stream;
+#   - optionally waits for a handshake/acknowledgement after each message;
+#   - reports progress and throughput as it goes.
+#
+# The output object need only provide a 'send' method accepting a sequence of
+# byte values, such as MidiOut in midiout.py.  Each call to MidiOut.send must
+# be a complete message (rtmidi rejects anything longer than 3 bytes that is
+# not a SysEx message starting with F0), so by default each SysEx message is
+# sent whole, and pacing is applied between messages.
+#
+# See: https://www.midi.org/specifications-old/item/table-4-universal-system-exclusive-messages
+#
+
+import mmap
+import os
+import time
+
+from midiutils import assertEq, MidiMessage
+
+DEFAULT_CHUNK_SIZE = 256
+
+# Roughly the sustained rate a Bluetooth LE MIDI link manages without dropping data
+DEFAULT_BYTES_PER_SECOND = 3000
+
+# -----------------
+# SysExFile class
+# -----------------
+
+class SysExFile:
+    """
+    Read-only memory-mapped view of a file containing one or more SysEx messages.
+
+    Use as a context manager, or call 'close' when done:  memoryviews handed out
+    by the iterators must not be used after the file is closed.
+    """
+
+    def __init__(self, path):
+        self.path  = path
+        self.file  = open(path, "rb")
+        self.mmap  = None
+        self.view  = None
+        self.size  = os.fstat(self.file.fileno()).st_size
+        if self.size == 0:
+            # An empty file cannot be mapped, and holds no messages
+            self.file.close()
+            self.file = None
+            return
+        try:
+            self.mmap  = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.close()
+            raise
+        self.view  = memoryview(self.mmap)
+        if self.mmap[0] != MidiMessage.SYSEX_START:
+            self.close()
+            raise ValueError(f"SysExFile: {path} does not start with a SysEx message")
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return
+
+    def iter_messages(self):
+        # Iterator over memoryviews of the SysEx messages (F0 ... F7) in the file
+        start = 0
+        while start < self.size:
+            end = self.mmap.find(bytes([MidiMessage.SYSEX_END]), start)
+            if end < 0:
+                raise ValueError(f"SysExFile: unterminated SysEx message at offset {start}")
+            yield self.view[start:end+1]
+            start = end+1
+            if start < self.size and self.mmap[start] != MidiMessage.SYSEX_START:
+                raise ValueError(f"SysExFile: expected SysEx start at offset {start}")
+        return
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Iterator over (message_number, is_last_chunk, memoryview) triples that
+        cover every message in the file in pieces of at most 'chunk_size' bytes.
+        """
+        for n, message in enumerate(self.iter_messages()):
+            with message:
+                for offset in range(0, len(message), chunk_size):
+                    yield (n, offset+chunk_size >= len(message), message[offset:offset+chunk_size])
+        return
+
+# -----------------
+# RateLimiter class
+# -----------------
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter:  allows bursts of up to 'burst' bytes, and an
+    average of 'bytes_per_second' bytes per second over longer periods.
+    """
+
+    def __init__(self, bytes_per_second, burst=None, now=time.monotonic, sleep=time.sleep):
+        """
+        Create a RateLimiter object.
+
+        bytes_per_second    is the sustained rate to allow
+        burst               is the bucket size in bytes (defaults to 1/10 second's worth)
+        now, sleep          are the functions used to read and wait on the clock
+        """
+        self.rate   = bytes_per_second
+        self.burst  = burst if burst is not None else max(1, bytes_per_second//10)
+        self.now    = now
+        self.sleep  = sleep
+        self.tokens = self.burst
+        self.last   = now()
+        return
+
+    def wait(self, nbytes):
+        # Block until 'nbytes' bytes may be sent, then consume that allowance
+        while True:
+            t = self.now()
+            self.tokens = min(self.burst, self.tokens + (t-self.last)*self.rate)
+            self.last   = t
+            if self.tokens >= min(nbytes, self.burst):
+                self.tokens -= nbytes
+                return
+            self.sleep((min(nbytes, self.burst)-self.tokens)/self.rate)
+
+# -----------------
+# SysExProgress class
+# -----------------
+
+class SysExProgress:
+    """
+    Progress of a SysEx transfer, passed to progress callbacks and returned
+    when the transfer completes.
+    """
+
+    def __init__(self, total_bytes, start_time):
+        self.total_bytes = total_bytes
+        self.sent_bytes  = 0
+        self.messages    = 0
+        self.chunks      = 0
+        self.start_time  = start_time
+        self.elapsed     = 0.0
+        return
+
+    def fraction(self):
+        return self.sent_bytes/self.total_bytes if self.total_bytes else 1.0
+
+    def throughput(self):
+        # Returns average bytes per second so far
+        return self.sent_bytes/self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return ( f"SysEx {self.sent_bytes}/{self.total_bytes} bytes ({self.fraction():.0%}), "
+                 f"{self.messages} messages, {self.throughput():.0f} bytes/s" )
+
+# -----------------
+# Transfer function
+# -----------------
+
+def send_sysex_file(midiout, path,
+        chunk_size=None, bytes_per_second=DEFAULT_BYTES_PER_SECOND,
+        wait_ack=None, ack_timeout=1.0, progress=None,
+        now=time.monotonic, sleep=time.sleep):
+    """
+    Stream the SysEx messages in a file to a MIDI output.
+
+    midiout             is an object with a 'send' method taking a sequence of bytes
+    path                is the name of a .syx file
+    chunk_size          if provided is the maximum number of bytes passed to each
+                        'send' call, splitting messages into partial chunks.  Only
+                        for outputs that accept a raw MIDI byte stream:  by default
+                        each message is sent whole, as rtmidi requires.
+    bytes_per_second    is the rate limit, or None for no limit
+    wait_ack            if provided is a function called as wait_ack(timeout) after
+                        each complete message.  It should return True when the
+                        receiver has acknowledged the message, or False on timeout.
+    progress            if provided is a function called with a SysExProgress object
+                        after each message or chunk is sent.
+    now, sleep          are the functions used to read and wait on the clock
+
+    Returns the final SysExProgress object.  Raises TimeoutError if an
+    acknowledgement is not received.
+    """
+    limiter = RateLimiter(bytes_per_second, now=now, sleep=sleep) if bytes_per_second else None
+    with SysExFile(path) as syx:
+        status = SysExProgress(syx.size, now())
+        if chunk_size:
+            chunks = syx.iter_chunks(chunk_size)
+        else:
+            chunks = ((n, True, m) for n, m in enumerate(syx.iter_messages()))
+        try:
+            for msgnum, last, chunk in chunks:
+                # Release each view of the file as soon as it has been sent, so
+                # the file can be closed even if sending fails
+                with chunk:
+                    if limiter:
+                        limiter.wait(len(chunk))
+                    midiout.send(chunk.tobytes())
+                    status.sent_bytes += len(chunk)
+                status.chunks += 1
+                if last:
+                    status.messages += 1
+                    if wait_ack and not wait_ack(ack_timeout):
+                        raise TimeoutError(f"send_sysex_file: no acknowledgement for message {msgnum}")
+                status.elapsed = now() - status.start_time
+                if progress:
+                    progress(status)
+        finally:
+            chunks.close()
+    return status
+
+# ---- Test ----
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    class VirtualTime:
+        # Clock that advances only when slept on
+        def __init__(self):
+            self.t = 0.0
+        def now(self):
+            return self.t
+        def sleep(self, secs):
+            self.t += secs
+
+    class CollectOut:
+        # Raw byte-stream output:  accepts any sequence of bytes
+        def __init__(self):
+            self.sent = []
+        def send(self, message):
+            self.sent.append(bytes(message))
+
+    class RtmidiRuleOut(CollectOut):
+        # Output that enforces rtmidi's send_message rule
+        def send(self, message):
+            if len(message) > 3 and message[0] != MidiMessage.SYSEX_START:
+                raise ValueError("message longer than 3 bytes but does not start with 0xF0")
+            CollectOut.send(self, message)
+
+    messages = [
+        MidiMessage.sysex([0x7D], range(100)),
+        MidiMessage.sysex([0x7D], [i % 128 for i in range(1000)]),
+        MidiMessage.sysex([0x7D], [1, 2, 3]),
+        ]
+    fd, path = tempfile.mkstemp(suffix=".syx")
+    with os.fdopen(fd, "wb") as f:
+        for m in messages:
+            f.write(bytes(m))
+    try:
+        with SysExFile(path) as syx:
+            assertEq([m.tobytes() for m in syx.iter_messages()], [bytes(m) for m in messages])
+        clock   = VirtualTime()
+        out     = CollectOut()
+        acks    = []
+        reports = []
+        result  = send_sysex_file(out, path, chunk_size=128, bytes_per_second=1000,
+            wait_ack=lambda timeout: acks.append(timeout) or True,
+            progress=lambda p: reports.append(p.sent_bytes),
+            now=clock.now, sleep=clock.sleep)
+        assertEq(b"".join(out.sent), b"".join(bytes(m) for m in messages))
+        assertEq(max(len(c) for c in out.sent), 128)
+        assertEq(len(acks), 3)
+        assertEq(result.messages, 3)
+        assertEq(reports[-1], result.total_bytes)
+        # 1111 bytes at 1000 bytes/s, less the initial 100-byte burst allowance
+        assertEq(abs(clock.t - 1.011) < 0.01, True)
+        print(result)
+        # Default:  whole messages, acceptable to rtmidi, paced between messages
+        clock  = VirtualTime()
+        out    = RtmidiRuleOut()
+        times  = []
+        result = send_sysex_file(out, path, bytes_per_second=1000,
+            progress=lambda p: times.append(clock.t),
+            now=clock.now, sleep=clock.sleep)
+        assertEq(out.sent, [bytes(m) for m in messages])
+        assertEq(result.chunks, 3)
+        # Message 1 (103 bytes) goes in the 100-byte burst, message 2 (1003 bytes)
+        # waits until the burst has refilled, and message 3 until message 2 is paid for
+        assertEq([round(t, 3) for t in times], [0.0, 0.103, 1.012])
+        try:
+            send_sysex_file(RtmidiRuleOut(), path, chunk_size=128, bytes_per_second=None)
+            assertEq("ValueError", "not raised")
+        except ValueError as e:
+            print(f"Expected: {e}")
+        try:
+            send_sysex_file(out, path, wait_ack=lambda timeout: False,
+                now=clock.now, sleep=clock.sleep)
+            assertEq("TimeoutError", "not raised")
+        except TimeoutError as e:
+            print(f"Expected: {e}")
+        # Empty file:  no messages, and no file left open
+        with open(path, "wb") as f:
+            pass
+        with SysExFile(path) as syx:
+            assertEq((syx.size, list(syx.iter_messages())), (0, []))
+        assertEq(send_sysex_file(CollectOut(), path).messages, 0)
+    finally:
+        os.remove(path)
+# ----
+
+# End.
@@ -0,0 +1,307 @@
+# tempomap.py
+#
+# Tempo map for converting between musical time (PPQ ticks) and real time (seconds).
+#
+# Defines class 'TempoMap', which holds tempo changes and time signatures for a
+# piece, and keeps a cumulative index over the tempo changes so that conversions
+# in either direction are binary searches (O(log n) in the number of tempo
+# changes) rather than linear scans from the start of the piece.
+#
+# Tempo values follow the Standard MIDI File convention of microseconds per
+# quarter note;  tick positions are counted in pulses per quarter note (PPQ).
+#
+# NumPy is imported only when the vectorised conversions are used, so that
+# modules needing just the scalar conversions load quickly.
+#
+# See: https://www.music.mcgill.ca/~ich/classes/mumt306/StandardMIDIfileformat.html
+#
+
+from bisect import bisect_right
+import threading
+
+from midiutils import assertEq
+
+# Default tempo (120 BPM) and time signature per the Standard MIDI File spec
+DEFAULT_PPQ     = 480
+DEFAULT_TEMPO   = 500000
+DEFAULT_TIMESIG = (4, 4)
+
+def bpm_to_tempo(bpm):
+    # Returns tempo in microseconds per quarter note for the given beats per minute
+    return int(round(60000000/bpm))
+
+def tempo_to_bpm(tempo):
+    # Returns beats per minute for the given tempo in microseconds per quarter note
+    return 60000000/tempo
+
+# --------------
+# TempoMap class
+# --------------
+
+class TempoMap:
+    """
+    Represents the tempo changes and time signatures of a piece, and converts
+    between tick positions and elapsed seconds.
+
+    Tempo changes are held in three parallel lists, ordered by tick:
+
+        tempo_ticks     tick at which each tempo takes effect
+        tempo_values    tempo (microseconds per quarter note) from that tick
+        tempo_seconds   elapsed seconds at that tick (the cumulative index)
+
+    The first entry is always at tick 0.  Adding a change recomputes the index
+    from the insertion point onwards;  lookups never scan.
+
+    Changes and lookups are serialised by 'lock', so one thread (such as a
+    clock generator's timing thread, or a Scheduler) may read the map while
+    another changes the tempo.
+    """
+
+    def __init__(self, ppq=DEFAULT_PPQ, tempo=DEFAULT_TEMPO, timesig=DEFAULT_TIMESIG):
+        """
+        Create a TempoMap object.
+
+        ppq         is the number of ticks (pulses) per quarter note
+        tempo       is the initial tempo, in microseconds per quarter note
+        timesig     is the initial time signature, as a (numerator, denominator) pair
+        """
+        self.ppq            = ppq
+        self.tempo_ticks    = [0]
+        self.tempo_values   = [tempo]
+        self.tempo_seconds  = [0.0]
+        self.timesig_ticks  = [0]
+        self.timesig_values = [tuple(timesig)]
+        self.timesig_bars   = [0]
+        self._arrays        = None
+        self.lock           = threading.RLock()
+        return
+
+    def __str__(self):
+        return (f"TempoMap(ppq={self.ppq}, "
+                f"{len(self.tempo_ticks)} tempo, {len(self.timesig_ticks)} timesig)")
+
+    # ---- Building the map ----
+
+    def add_tempo(self, tick, tempo):
+        """
+        Add a tempo change, replacing any existing change at the same tick.
+
+        tick        is the tick position at which the new tempo takes effect
+        tempo       is the new tempo, in microseconds per quarter note
+        """
+        if tick < 0:
+            raise ValueError(f"TempoMap.add_tempo: negative tick {tick}")
+        with self.lock:
+            i = bisect_right(self.tempo_ticks, tick)
+            if self.tempo_ticks[i-1] == tick:
+                i -= 1
+                self.tempo_values[i] = tempo
+            else:
+                self.tempo_ticks.insert(i, tick)
+                self.tempo_values.insert(i, tempo)
+                self.tempo_seconds.insert(i, 0.0)
+            self._reindex_tempo(max(i, 1))
+        return
+
+    def add_tempo_bpm(self, tick, bpm):
+        # Add a tempo change expressed in beats (quarter notes) per minute
+        self.add_tempo(tick, bpm_to_tempo(bpm))
+        return
+
+    def add_timesig(self, tick, numerator, denominator):
+        """
+        Add a time signature change, replacing any existing change at the same tick.
+
+        tick        is the tick position at which the new time signature takes effect.
+                    This should fall on a bar boundary of the preceding time signature;
+                    if it does not, the partial bar is counted as a whole bar.
+        numerator   is the number of beats in a bar
+        denominator is the note value of one beat (4 = crotchet, 8 = quaver, etc.)
+        """
+        if tick < 0:
+            raise ValueError(f"TempoMap.add_timesig: negative tick {tick}")
+        with self.lock:
+            i = bisect_right(self.timesig_ticks, tick)
+            if self.timesig_ticks[i-1] == tick:
+                i -= 1
+                self.timesig_values[i] = (numerator, denominator)
+            else:
+                self.timesig_ticks.insert(i, tick)
+                self.timesig_values.insert(i, (numerator, denominator))
+                self.timesig_bars.insert(i, 0)
+            for j in range(max(i, 1), len(self.timesig_ticks)):
+                prevticks = self.timesig_ticks[j] - self.timesig_ticks[j-1]
+                bar_ticks = self.ticks_per_bar(self.timesig_values[j-1])
+                self.timesig_bars[j] = self.timesig_bars[j-1] - (-prevticks // bar_ticks)
+        return
+
+    def _reindex_tempo(self, start):
+        # Recompute cumulative seconds for tempo entries from index 'start' onwards;
+        # called with 'lock' held
+        ticks  = self.tempo_ticks
+        tempos = self.tempo_values
+        secs   = self.tempo_seconds
+        scale  = 1.0/(self.ppq*1000000)
+        for i in range(start, len(ticks)):
+            secs[i] = secs[i-1] + (ticks[i]-ticks[i-1])*tempos[i-1]*scale
+        self._arrays = None
+        return
+
+    # ---- Lookups ----
+
+    def tempo_at(self, tick):
+        # Returns tempo (microseconds per quarter note) in effect at the given tick
+        with self.lock:
+            return self.tempo_values[max(bisect_right(self.tempo_ticks, tick)-1, 0)]
+
+    def bpm_at(self, tick):
+        # Returns tempo (quarter notes per minute) in effect at the given tick
+        return tempo_to_bpm(self.tempo_at(tick))
+
+    def timesig_at(self, tick):
+        # Returns (numerator, denominator) time signature in effect at the given tick
+        with self.lock:
+            return self.timesig_values[max(bisect_right(self.timesig_ticks, tick)-1, 0)]
+
+    def ticks_per_beat(self, timesig):
+        # Returns number of ticks in one beat of the given time signature
+        return self.ppq*4//timesig[1]
+
+    def ticks_per_bar(self, timesig):
+        # Returns number of ticks in one bar of the given time signature
+        return self.ticks_per_beat(timesig)*timesig[0]
+
+    # ---- Conversions ----
+
+    def tick_to_seconds(self, tick):
+        """
+        Returns the elapsed time in seconds at the given tick position.
+
+        Ticks before 0 are extrapolated using the initial tempo.
+        """
+        with self.lock:
+            i = max(bisect_right(self.tempo_ticks, tick)-1, 0)
+            return ( self.tempo_seconds[i] +
+                     (tick-self.tempo_ticks[i])*self.tempo_values[i]/(self.ppq*1000000) )
+
+    def seconds_to_tick(self, seconds):
+        """
+        Returns the tick position (as a float) at the given elapsed time in seconds.
+
+        Use round() or int() on the result to obtain a whole tick number.
+        """
+        with self.lock:
+            i = max(bisect_right(self.tempo_seconds, seconds)-1, 0)
+            return ( self.tempo_ticks[i] +
+                     (seconds-self.tempo_seconds[i])*self.ppq*1000000/self.tempo_values[i] )
+
+    def tick_to_bar_beat(self, tick):
+        """
+        Returns a (bar, beat, tick) triple for the given tick position, where
+        bar and beat are counted from 1 and tick is the offset within the beat.
+        """
+        with self.lock:
+            i       = max(bisect_right(self.timesig_ticks, tick)-1, 0)
+            timesig = self.timesig_values[i]
+            offset  = tick - self.timesig_ticks[i]
+            bars    = self.timesig_bars[i]
+        bar, offset  = divmod(offset, self.ticks_per_bar(timesig))
+        beat, offset = divmod(offset, self.ticks_per_beat(timesig))
+        return (bars+bar+1, beat+1, offset)
+
+    def bar_beat_to_tick(self, bar, beat=1, tick=0):
+        # Returns the tick position of the given bar and beat (counted from 1)
+        with self.lock:
+            i       = max(bisect_right(self.timesig_bars, bar-1)-1, 0)
+            timesig = self.timesig_values[i]
+            return ( self.timesig_ticks[i] +
+                     (bar-1-self.timesig_bars[i])*self.ticks_per_bar(timesig) +
+                     (beat-1)*self.ticks_per_beat(timesig) + tick )
+
+    # ---- Vectorised conversions ----
+
+    def _get_arrays(self):
+        # Returns NumPy copies of the tempo index, rebuilt only after the map changes
+        with self.lock:
+            if self._arrays is None:
+                import numpy
+                ticks  = numpy.array(self.tempo_ticks,   dtype=numpy.float64)
+                secs   = numpy.array(self.tempo_seconds, dtype=numpy.float64)
+                rate   = numpy.array(self.tempo_values,  dtype=numpy.float64)/(self.ppq*1000000)
+                self._arrays = (ticks, secs, rate)
+            return self._arrays
+
+    def ticks_to_seconds(self, ticks):
+        """
+        Converts an array (or any sequence) of tick positions to a NumPy array of
+        elapsed seconds, using one vectorised binary search over the tempo index.
+        """
+        import numpy
+        ticks = numpy.asarray(ticks, dtype=numpy.float64)
+        tempo_ticks, tempo_secs, rate = self._get_arrays()
+        i = numpy.searchsorted(tempo_ticks, ticks, side='right') - 1
+        numpy.maximum(i, 0, out=i)
+        return tempo_secs[i] + (ticks-tempo_ticks[i])*rate[i]
+
+    def seconds_to_ticks(self, seconds):
+        """
+        Converts an array (or any sequence) of elapsed times in seconds to a NumPy
+        array of (fractional) tick positions.
+        """
+        import numpy
+        seconds = numpy.asarray(seconds, dtype=numpy.float64)
+        tempo_ticks, tempo_secs, rate = self._get_arrays()
+        i = numpy.searchsorted(tempo_secs, seconds, side='right') - 1
+        numpy.maximum(i, 0, out=i)
+        return tempo_ticks[i] + (seconds-tempo_secs[i])/rate[i]
+
+# ---- Test ----
+if __name__ == "__main__":
+    import random
+    import time
+    import numpy
+    tm = TempoMap(ppq=480)
+    assertEq(tm.tick_to_seconds(480), 0.5)
+    assertEq(tm.seconds_to_tick(1.0), 960.0)
+    # Change to 60 BPM after 2 beats, then 240 BPM after 2 more
+    tm.add_tempo_bpm(960, 60)
+    tm.add_tempo_bpm(1920, 240)
+    assertEq(tm.tick_to_seconds(960),  1.0)
+    assertEq(tm.tick_to_seconds(1920), 3.0)
+    assertEq(tm.tick_to_seconds(2400), 3.25)
+    assertEq(tm.seconds_to_tick(1.5),  1200.0)
+    assertEq(tm.seconds_to_tick(3.25), 2400.0)
+    assertEq(tm.bpm_at(1000), 60.0)
+    # Out-of-order insertion reindexes later entries
+    tm.add_tempo_bpm(480, 120)
+    assertEq(tm.tick_to_seconds(2400), 3.25)
+    tm.add_tempo_bpm(0, 60)
+    assertEq(tm.tick_to_seconds(960), 1.5)
+    assertEq(list(tm.ticks_to_seconds([0, 480, 960, 2400])), [0.0, 1.0, 1.5, 3.75])
+    assertEq(list(tm.seconds_to_ticks([0.0, 1.0, 1.5, 3.75])), [0.0, 480.0, 960.0, 2400.0])
+    # Time signatures:  2 bars of 4/4, then 3/4, then 6/8
+    tm.add_timesig(3840, 3, 4)
+    tm.add_timesig(3840+2*1440, 6, 8)
+    assertEq(tm.timesig_at(4000), (3, 4))
+    assertEq(tm.tick_to_bar_beat(0),    (1, 1, 0))
+    assertEq(tm.tick_to_bar_beat(3840), (3, 1, 0))
+    assertEq(tm.tick_to_bar_beat(3840+1440+480+10), (4, 2, 10))
+    assertEq(tm.tick_to_bar_beat(6720+240), (5, 2, 0))
+    assertEq(tm.bar_beat_to_tick(5, 2), 6720+240)
+    assertEq(tm.bar_beat_to_tick(4, 2, 10), 3840+1440+480+10)
+    # Round trip with many tempo changes
+    tm = TempoMap(ppq=960)
+    for t in range(1, 10000):
+        tm.add_tempo_bpm(t*960, random.uniform(40, 200))
+    ticks = numpy.arange(0, 10000*960, 7, dtype=numpy.float64)
+    t0    = time.perf_counter()
+    secs  = tm.ticks_to_seconds(ticks)
+    back  = tm.seconds_to_ticks(secs)
+    t1    = time.perf_counter()
+    assertEq(bool(numpy.allclose(back, ticks)), True)
+    assertEq(abs(tm.tick_to_seconds(int(ticks[-1])) - secs[-1]) < 1e-9, True)
+    print(f"{len(ticks)} ticks converted both ways over {len(tm.tempo_ticks)} "
+          f"tempo changes in {(t1-t0)*1000:.1f}ms")
+# ----
+
+# End.
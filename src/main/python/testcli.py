@@ -0,0 +1,99 @@
+# testcli.py
+#
+# Tests for the command line interface in midicli.py:  the output of 'render',
+# and the cold start time and imported modules of 'list-ports' and 'render'.
+#
+# Each startup test runs the command in a fresh interpreter, so the times
+# include interpreter startup, and checks which heavy modules were loaded.
+# 'list-ports' needs rtmidi to list anything;  without it the command fails,
+# but its startup time and imports are still checked.
+#
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from midiutils import assertEq, Patch, MidiMessage
+from smf import SMFReader, META
+import midicli
+import playback
+
+# Cold start budget (seconds) for a command, including interpreter startup
+STARTUP_BUDGET = 0.3
+
+# Modules that must not be loaded by each command
+HEAVY_MODULES = ("rtmidi", "pygame", "numpy")
+FORBIDDEN_MODULES = {
+    "list-ports":   ("pygame", "numpy"),
+    "render":       HEAVY_MODULES,
+    }
+
+# ---- Test helpers ----
+
+def loaded_modules(argv):
+    # Run midicli.main(argv) in a fresh interpreter, and return which of the
+    # heavy modules it loaded
+    script = ( "import sys, contextlib, io, midicli\n"
+               "with contextlib.redirect_stdout(io.StringIO()), "
+               "contextlib.redirect_stderr(io.StringIO()):\n"
+              f"    midicli.main({argv!r})\n"
+              f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n" )
+    result = subprocess.run([sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(midicli.__file__)),
+        capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def check_startup(argv):
+    # Check cold start time and imports of a command;  returns best time and status
+    times, status = midicli.startup_times(argv, 3)
+    assertEq(min(times) < STARTUP_BUDGET, True)
+    forbidden = FORBIDDEN_MODULES[argv[0]]
+    assertEq([m for m in loaded_modules(argv) if m in forbidden], [])
+    return (min(times), status)
+
+# ---- Tests ----
+
+def check_render_output(path):
+    midicli.main(["render", "chords", "-o", path, "--ppq", "96", "--bpm", "60", "-q"])
+    reader = SMFReader(path)
+    assertEq((reader.format, len(reader.tracks), reader.ppq), (0, 1, 96))
+    events = list(reader.iter_track(0))
+    assertEq(events[0], (0, [META, 0x51, 0x0F, 0x42, 0x40]))
+    # At 60 BPM there are 96 ticks per second
+    expected = [ (int(round(t*96)), m) for t, m in playback.record("chords") ]
+    assertEq(events[1:], expected)
+    assertEq(events[1], (0, MidiMessage.program_change(1, Patch.GRAND_PIANO)))
+    assertEq(events[-1][0], int(round((4*5*0.55 - 0.05)*96)))
+    return
+
+def check_render_startup(path):
+    best, status = check_startup(["render", "chords", "-o", path, "-q"])
+    assertEq(status, 0)
+    return best
+
+def check_list_ports_startup():
+    best, status = check_startup(["list-ports"])
+    try:
+        import rtmidi
+        assertEq(status, 0)
+    except ImportError:
+        print("list-ports: rtmidi not installed, startup only checked")
+    return best
+
+# ---- Test ----
+if __name__ == "__main__":
+    fd, path = tempfile.mkstemp(suffix=".mid")
+    os.close(fd)
+    try:
+        check_render_output(path)
+        print("check_render_output: ok")
+        best = check_render_startup(path)
+        print(f"check_render_startup: ok ({best*1000:.0f}ms)")
+        best = check_list_ports_startup()
+        print(f"check_list_ports_startup: ok ({best*1000:.0f}ms)")
+    finally:
+        os.remove(path)
+# ----
+
+# End.
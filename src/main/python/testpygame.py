@@ -8,6 +8,9 @@ import time
 import pygame
 import pygame.midi
 
+from midiutils import Note, Patch, MidiMessage
+from pygamemidi import PygameMidiOut, note_sequence
+
 
 # @@TODO:
 #
@@ -42,62 +45,35 @@ def _print_device_info():
 
 
 def test_piano_scale(device_id=None):
-
-    GRAND_PIANO = 0
-    CHURCH_ORGAN = 19
-
-    MIDI_NUMBER_MID_C = 60
-    MIDI_NAME_MID_C   = "C3"
-
-
-    MIDI_NOTE_C3  = 60
-    MIDI_NOTE_C3s = 61
-    MIDI_NOTE_D3  = 62
-    MIDI_NOTE_D3s = 63
-    MIDI_NOTE_E3  = 64
-    MIDI_NOTE_F3  = 65
-    MIDI_NOTE_F3s = 66
-    MIDI_NOTE_G3  = 67
-    MIDI_NOTE_G3s = 68
-    MIDI_NOTE_A3  = 69
-    MIDI_NOTE_A3s = 70
-    MIDI_NOTE_B3  = 71
-    MIDI_NOTE_C4  = 72
-
-    instrument = GRAND_PIANO
-    #instrument = CHURCH_ORGAN
+    # Channel number to use, in range 1-16, appears in the initial message byte
+    channel = 1
+    # Instrument (program number) to use, in range 1-128
+    patch = Patch.GRAND_PIANO
+    # patch = Patch.CHURCH_ORGAN
 
     pygame.init()
     pygame.midi.init()
     _print_device_info()
 
-    if device_id is None:
-        port = pygame.midi.get_default_output_id()
-    else:
-        port = device_id
-    print(f"using output_id :{port}:")
-
-    midi_out = pygame.midi.Output(port, latency=0)
-    midi_out.set_instrument(instrument, channel=0)
+    midi_out = PygameMidiOut(device_id)
+    print(f"using output_id :{midi_out.device_id}:")
     try:
-        for i in range(1):
-            scale_notes = (
-                MIDI_NOTE_C3,
-                MIDI_NOTE_D3,
-                MIDI_NOTE_E3,
-                MIDI_NOTE_F3,
-                MIDI_NOTE_G3,
-                MIDI_NOTE_A3,
-                MIDI_NOTE_B3,
-                MIDI_NOTE_C4,
-                )
-            for note in (scale_notes):
-                print(f"Play note {note}")
-                midi_out.note_on(note, 64, channel=0)
-                time.sleep(0.5)
-                midi_out.note_off(note, 64, channel=0)
-                time.sleep(0.1)
-
+        midi_out.send(MidiMessage.program_change(channel, patch))
+        scale_notes = (
+            Note.C4,
+            Note.D4,
+            Note.E4,
+            Note.F4,
+            Note.G4,
+            Note.A4,
+            Note.B4,
+            Note.C5,
+            )
+        # Whole scale is handed to PortMidi up front;  its scheduler does the timing
+        events = note_sequence(channel, scale_notes, 0.5, 0.1)
+        start  = midi_out.schedule(events)
+        print(f"Scheduled {len(events)} events at {start}ms")
+        time.sleep(events[-1][0] + 0.5)
     finally:
         midi_out.close()
         del midi_out
@@ -106,4 +82,5 @@ def test_piano_scale(device_id=None):
     # Exit
 
 
-test_piano_scale(8)
+if __name__ == "__main__":
+    test_piano_scale(8)
@@ -0,0 +1,100 @@
+# testvirtual.py
+#
+# Runs the playback tests in testpyrtmidi.py against a virtual clock and a
+# loopback output, and checks the exact timestamped messages they produce.
+#
+# No MIDI device is needed, and playback that takes minutes in real time
+# completes in milliseconds.
+#
+
+import contextlib
+import io
+import time
+
+from midiutils import assertEq, Note, KeySignature, Patch, Patches, MidiMessage
+from clocks import VirtualClock
+from midiout import LoopbackMidiOut
+
+import testpyrtmidi
+
+# ---- Test helpers ----
+
+def run_virtual(test_fn):
+    # Run a playback test function with its output captured;  returns the
+    # (time, message) list it sent and the wall-clock seconds taken
+    midiout = LoopbackMidiOut(VirtualClock())
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        test_fn(midiout=midiout)
+    return (midiout.sent, time.perf_counter()-t0)
+
+def rounded(sent):
+    # Round times to avoid mismatches from floating point accumulation
+    return [ (round(t, 6), m) for t, m in sent ]
+
+def note_events(channel, notes, t, on_time, off_time):
+    # Returns expected events for notes played in turn, and the time after them
+    events = []
+    for n in notes:
+        events.append((round(t, 6), MidiMessage.note_on(channel, n)))
+        t += on_time
+        events.append((round(t, 6), MidiMessage.note_off(channel, n)))
+        t += off_time
+    return (events, t)
+
+# ---- Tests ----
+
+def check_virtual_keysig_scales():
+    sent, wall = run_virtual(testpyrtmidi.test_keysig_scales)
+    expected = [(0.0, MidiMessage.program_change(1, Patch.GRAND_PIANO))]
+    t = 0.0
+    for k in KeySignature.iter_keys():
+        keysig = KeySignature.get_key(k)
+        notes  = list(keysig.iter_octave(4)) + [keysig.get_note(5, 1)]
+        events, t = note_events(1, notes + list(reversed(notes[:-1])), t, 0.25, 0.1)
+        expected.extend(events)
+    assertEq(rounded(sent), expected)
+    assertEq(round(t, 6), 14*15*0.35)
+    return wall
+
+def check_virtual_scales():
+    sent, wall = run_virtual(testpyrtmidi.test_scales)
+    scale_notes = [ Note.C3, Note.D3, Note.E3, Note.F3, Note.G3, Note.A3, Note.B3
+                  , Note.C4, Note.D4, Note.E4, Note.F4, Note.G4, Note.A4, Note.B4
+                  , Note.C5 ]
+    expected = []
+    t = 0.0
+    for p in Patches():
+        expected.append((round(t, 6), MidiMessage.program_change(1, p)))
+        events, t = note_events(1, scale_notes, t, 0.25, 0.05)
+        expected.extend(events)
+    assertEq(rounded(sent), expected)
+    assertEq(len(sent), 128*31)
+    return wall
+
+def check_virtual_Cmaj_chords():
+    sent, wall = run_virtual(testpyrtmidi.test_Cmaj_chords)
+    assertEq(len(sent), 1 + 4*5*6)
+    assertEq(rounded(sent[1:7]),
+        [ (0.0, [0x90, 60, 64]), (0.0, [0x90, 64, 64]), (0.0, [0x90, 67, 64])
+        , (0.5, [0x80, 60, 64]), (0.5, [0x80, 64, 64]), (0.5, [0x80, 67, 64])
+        ])
+    assertEq(round(sent[-1][0], 6), 4*5*0.55 - 0.05)
+    return wall
+
+def check_virtual_Cmaj_arpeggios():
+    sent, wall = run_virtual(testpyrtmidi.test_Cmaj_arpeggios)
+    # Per chord: chord on (3), 5 arpeggio notes (10), chord off (3)
+    assertEq(len(sent), 2 + 2*5*16)
+    assertEq(round(sent[-1][0], 6), 2*5*6*0.35 - 0.35)
+    return wall
+
+# ---- Test ----
+if __name__ == "__main__":
+    for test in ( check_virtual_keysig_scales, check_virtual_scales
+                , check_virtual_Cmaj_chords, check_virtual_Cmaj_arpeggios ):
+        wall = test()
+        print(f"{test.__name__}: ok ({wall*1000:.0f}ms)")
+# ----
+
+# End.
@@ -0,0 +1,446 @@
+# tracing.py
+#
+# Opt-in tracing of the MIDI playback pipeline.
+#
+# Defines class 'Tracer', which records named spans (start and end times from
+# time.perf_counter_ns) into a fixed-size ring buffer held in arrays, so that
+# recording allocates nothing and tracing can be left on for a while with
+# only the most recent spans kept.
+#
+# Functions and methods are traced by wrapping them in place ('instrument'),
+# and untraced by putting the originals back ('uninstrument'), so code that is
+# not being traced runs exactly as before, with no added overhead.  Because
+# the wrappers replace class attributes, they apply wherever the class is used.
+# Code that fetched a wrapper before it was removed (such as a bound method
+# saved in a local variable) can still call it, so 'stop' also clears the
+# Tracer's 'enabled' flag, which every wrapper checks before recording.
+#
+# 'default_targets' lists the pipeline stages traced by default:  note lookup
+# (KeySignature.get_note), message construction (MidiMessage functions) and
+# output (MidiOut.send, which calls rtmidi, and LoopbackMidiOut.send).
+#
+# Recorded spans can be exported as Chrome trace-event JSON, for viewing in
+# chrome://tracing or https://ui.perfetto.dev, or summarised per stage.
+#
+# Typical use, to trace a block of code:
+#
+#   with tracing() as tracer:
+#       ...
+#   tracer.write_chrome_trace("trace.json")
+#   print(tracer.format_summary())
+#
+# or to trace a running program for a few seconds:
+#
+#   tracer = start_tracing(seconds=5)
+#
+# See: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+#
+
+from array import array
+import contextlib
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+
+from midiutils import assertEq, KeySignature, MidiMessage
+
+# Default number of spans held in the ring buffer (a power of 2)
+DEFAULT_CAPACITY = 1 << 16
+
+# ------------
+# Tracer class
+# ------------
+
+class Tracer:
+    """
+    Records named spans into a ring buffer.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, now_ns=time.perf_counter_ns):
+        """
+        Create a Tracer object.
+
+        capacity    is the number of spans held;  once full, each new span
+                    replaces the oldest.  Rounded up to a power of 2.
+        now_ns      is a function returning the current time in integer
+                    nanoseconds;  defaults to time.perf_counter_ns.
+        """
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask     = size-1
+        self.now_ns   = now_ns
+        self.origin   = now_ns()
+        self.starts   = array('q', bytes(8*size))
+        self.ends     = array('q', bytes(8*size))
+        self.names    = array('l', bytes(array('l').itemsize*size))
+        self.threads  = array('Q', bytes(8*size))
+        self.name_ids = {}          # Span name -> index in span_names
+        self.span_names = []
+        self.installed  = []        # (owner, attr, original) for each wrapped target
+        self.lock     = threading.Lock()    # Guards 'installed'
+        self.enabled  = True        # Spans are recorded only while True
+        self.slots    = itertools.count()   # next() is atomic, so threads get distinct slots
+        self.recorded = 0           # Number of spans recorded
+        self.first    = 0           # Number of first span not discarded by 'reset'
+        return
+
+    def reset(self):
+        # Discard all recorded spans
+        self.first = self.recorded
+        return
+
+    def name_id(self, name):
+        # Returns the number used to record spans with the given name
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.span_names)
+            self.span_names.append(name)
+        return self.name_ids[name]
+
+    # ---- Recording ----
+
+    def record(self, name_id, start, end):
+        # Record a span, given its name number and start and end times (ns)
+        n = next(self.slots)
+        i = n & self.mask
+        self.starts[i]  = start
+        self.ends[i]    = end
+        self.names[i]   = name_id
+        self.threads[i] = threading.get_ident()
+        self.recorded   = n+1
+        return
+
+    @contextlib.contextmanager
+    def span(self, name):
+        # Context manager recording a span around a block of code
+        name_id = self.name_id(name)
+        start   = self.now_ns()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.record(name_id, start, self.now_ns())
+        return
+
+    def wrap(self, func, name):
+        # Returns a function that calls 'func', recording a span named 'name'.
+        # Recording is inlined (as in 'record') to keep the overhead per call low.
+        name_id = self.name_id(name)
+        now_ns  = self.now_ns
+        slots, mask = self.slots, self.mask
+        starts, ends, names, threads = self.starts, self.ends, self.names, self.threads
+        get_ident = threading.get_ident
+        def traced(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = now_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = now_ns()
+                if self.enabled:
+                    n = next(slots)
+                    i = n & mask
+                    starts[i]  = start
+                    ends[i]    = end
+                    names[i]   = name_id
+                    threads[i] = get_ident()
+                    self.recorded = n+1
+        traced.__wrapped__ = func
+        traced.__name__    = getattr(func, "__name__", name)
+        traced.__doc__     = getattr(func, "__doc__", None)
+        return traced
+
+    # ---- Instrumentation ----
+
+    def instrument(self, owner, attr, name=None):
+        """
+        Replace function or method 'attr' of 'owner' (a class, module or object)
+        with a traced version, until 'uninstrument' is called.
+
+        name        is the span name;  defaults to "<owner name>.<attr>"
+        """
+        if name is None:
+            name = f"{getattr(owner, '__name__', type(owner).__name__)}.{attr}"
+        original = inspect.getattr_static(owner, attr)
+        if isinstance(original, staticmethod):
+            traced = staticmethod(self.wrap(original.__func__, name))
+        elif isinstance(original, classmethod):
+            raise ValueError(f"Tracer.instrument: cannot trace classmethod {name}")
+        else:
+            traced = self.wrap(getattr(owner, attr) if not inspect.isclass(owner) else original, name)
+        own = attr in getattr(owner, "__dict__", {})
+        setattr(owner, attr, traced)
+        self.installed.append((owner, attr, original if own else None))
+        return
+
+    def instrument_targets(self, targets):
+        # Instrument each (owner, attr) or (owner, attr, name) in 'targets'
+        for target in targets:
+            self.instrument(*target)
+        return
+
+    def uninstrument(self):
+        # Restore everything instrumented, most recent first.  May be called
+        # from more than one thread (e.g. a timer and the main program).
+        with self.lock:
+            while self.installed:
+                owner, attr, original = self.installed.pop()
+                if original is None:
+                    delattr(owner, attr)
+                else:
+                    setattr(owner, attr, original)
+        return
+
+    def stop(self):
+        # Stop recording, including through wrappers already fetched by callers,
+        # and remove instrumentation
+        self.enabled = False
+        self.uninstrument()
+        return
+
+    # ---- Results ----
+
+    def spans(self):
+        """
+        Returns a list of (name, start_ns, end_ns, thread) for the spans held,
+        oldest first.  Times are measured from the creation of the Tracer.
+        """
+        first  = max(self.first, self.recorded - self.capacity)
+        result = []
+        for n in range(first, self.recorded):
+            i = n & self.mask
+            result.append(( self.span_names[self.names[i]]
+                          , self.starts[i] - self.origin
+                          , self.ends[i] - self.origin
+                          , self.threads[i] ))
+        return result
+
+    def dropped(self):
+        # Returns the number of spans overwritten because the buffer was full
+        return max(self.recorded - self.capacity - self.first, 0)
+
+    def chrome_trace(self):
+        # Returns the spans held as a Chrome trace-event format dictionary
+        pid = os.getpid()
+        events = [ { "name": name, "cat": name.split(".")[0], "ph": "X"
+                   , "ts": start/1000, "dur": (end-start)/1000
+                   , "pid": pid, "tid": thread }
+                   for name, start, end, thread in self.spans() ]
+        return { "traceEvents": events, "displayTimeUnit": "ms" }
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return
+
+    def summary(self):
+        """
+        Returns a dictionary of statistics for each span name, with times in
+        microseconds:
+
+        count       number of spans
+        total       total time, including time in nested spans
+        self        total time, excluding time in nested spans
+        mean        mean time per span, including nested spans
+        max         longest span, including nested spans
+        """
+        stats = {}
+        for name in self.span_names:
+            stats[name] = { 'count': 0, 'total': 0, 'self': 0, 'max': 0 }
+        # Sort by thread and start, outer spans first, to find nesting
+        ordered = sorted(self.spans(), key=lambda s: (s[3], s[1], -s[2]))
+        stack   = []    # Open spans:  (end, stats) of enclosing spans
+        thread  = None
+        for name, start, end, tid in ordered:
+            if tid != thread:
+                stack  = []
+                thread = tid
+            while stack and stack[-1][0] <= start:
+                stack.pop()
+            duration = end-start
+            s = stats[name]
+            s['count'] += 1
+            s['total'] += duration
+            s['self']  += duration
+            s['max']    = max(s['max'], duration)
+            if stack and end <= stack[-1][0]:
+                stack[-1][1]['self'] -= duration
+            stack.append((end, s))
+        result = {}
+        for name, s in stats.items():
+            if s['count']:
+                result[name] = { 'count': s['count']
+                               , 'total': s['total']/1000
+                               , 'self':  s['self']/1000
+                               , 'mean':  s['total']/s['count']/1000
+                               , 'max':   s['max']/1000 }
+        return result
+
+    def format_summary(self):
+        # Returns the summary as a table, stages with most self time first
+        rows = sorted(self.summary().items(), key=lambda r: -r[1]['self'])
+        lines = [ f"{'stage':32s} {'count':>8s} {'self ms':>10s} {'total ms':>10s} "
+                  f"{'mean us':>9s} {'max us':>9s}" ]
+        for name, s in rows:
+            lines.append( f"{name:32s} {s['count']:8d} {s['self']/1000:10.3f} "
+                          f"{s['total']/1000:10.3f} {s['mean']:9.2f} {s['max']:9.1f}" )
+        if self.dropped():
+            lines.append(f"({self.dropped()} earlier spans dropped)")
+        return "\n".join(lines)
+
+# ---- Default targets ----
+
+def default_targets():
+    # Returns (owner, attr) for each pipeline stage traced by default
+    from midiout import MidiOut, LoopbackMidiOut
+    targets = [(KeySignature, "get_note")]
+    for attr, value in MidiMessage.__dict__.items():
+        if isinstance(value, staticmethod):
+            targets.append((MidiMessage, attr))
+    targets.append((MidiOut, "send"))
+    targets.append((LoopbackMidiOut, "send"))
+    return targets
+
+def start_tracing(targets=None, seconds=None, tracer=None, capacity=DEFAULT_CAPACITY):
+    """
+    Instrument 'targets' (default: 'default_targets()'), and return the Tracer
+    recording them.
+
+    seconds     if provided is the time after which instrumentation is removed,
+                from a timer thread, so a running program can be traced for a
+                few seconds;  otherwise call the Tracer's 'stop' method.
+    """
+    tracer = tracer or Tracer(capacity)
+    tracer.enabled = True
+    tracer.instrument_targets(default_targets() if targets is None else targets)
+    if seconds is not None:
+        timer = threading.Timer(seconds, tracer.stop)
+        timer.daemon = True
+        timer.start()
+    return tracer
+
+@contextlib.contextmanager
+def tracing(targets=None, tracer=None, capacity=DEFAULT_CAPACITY):
+    """
+    Context manager that instruments 'targets' (default: 'default_targets()')
+    for the duration of a block, and yields the Tracer recording them.
+    """
+    tracer = start_tracing(targets, tracer=tracer, capacity=capacity)
+    try:
+        yield tracer
+    finally:
+        tracer.stop()
+    return
+
+# ---- Test ----
+if __name__ == "__main__":
+    from midiutils import Note
+    from clocks import VirtualClock
+    from midiout import LoopbackMidiOut
+    import playback
+
+    # Deterministic times:  each reading of the clock advances it by 10ns
+    ticks  = itertools.count(0, 10)
+    tracer = Tracer(capacity=6, now_ns=lambda: next(ticks))
+    assertEq(tracer.capacity, 8)
+    def inner(x):
+        return x+1
+    def outer(x):
+        return traced_inner(x)*2
+    traced_inner = tracer.wrap(inner, "inner")
+    traced_outer = tracer.wrap(outer, "outer")
+    assertEq(traced_outer(1), 4)
+    with tracer.span("block"):
+        traced_inner(0)
+    # Spans are listed in the order they finish, timed from the Tracer's creation
+    assertEq([s[:3] for s in tracer.spans()],
+        [("inner", 20, 30), ("outer", 10, 40), ("inner", 60, 70), ("block", 50, 80)])
+    summary = tracer.summary()
+    assertEq((summary["outer"]["total"], summary["outer"]["self"]), (0.03, 0.02))
+    assertEq((summary["inner"]["count"], summary["inner"]["self"]), (2, 0.02))
+    assertEq(summary["block"]["self"], 0.02)
+    # Ring buffer keeps the most recent spans
+    for _ in range(5):
+        traced_inner(0)
+    assertEq((len(tracer.spans()), tracer.dropped()), (8, 1))
+    assertEq(tracer.spans()[0][0], "outer")
+    trace = json.loads(json.dumps(tracer.chrome_trace()))
+    assertEq(trace["traceEvents"][0]["ph"], "X")
+    assertEq((trace["traceEvents"][0]["ts"], trace["traceEvents"][0]["dur"]), (0.01, 0.03))
+    tracer.reset()
+    assertEq((tracer.spans(), tracer.dropped()), ([], 0))
+    traced_inner(0)
+    assertEq(len(tracer.spans()), 1)
+
+    # Instrumenting the pipeline, and restoring it afterwards
+    original = MidiMessage.__dict__["note_on"]
+    with tracing() as tracer:
+        sent = playback.record("keysig-scales")
+    assertEq(MidiMessage.__dict__["note_on"], original)
+    assertEq("send" in LoopbackMidiOut.__dict__, True)
+    summary = tracer.summary()
+    assertEq(summary["LoopbackMidiOut.send"]["count"], len(sent))
+    assertEq(summary["MidiMessage.note_on"]["count"], 14*15)
+    assertEq(summary["KeySignature.get_note"]["count"] >= 14, True)
+    # Chord messages nest note messages
+    with tracing() as tracer:
+        playback.record("chords")
+    summary = tracer.summary()
+    assertEq(summary["MidiMessage.chord_on"]["count"], 20)
+    assertEq(summary["MidiMessage.note_on"]["count"], 60)
+    assertEq(summary["MidiMessage.chord_on"]["self"] < summary["MidiMessage.chord_on"]["total"], True)
+    # Instance attributes are removed again, leaving the class method
+    out = LoopbackMidiOut(VirtualClock())
+    tracer = Tracer()
+    tracer.instrument(out, "send", "out.send")
+    out.send(MidiMessage.note_on(1, Note.C4))
+    tracer.uninstrument()
+    assertEq("send" in out.__dict__, False)
+    assertEq(len(tracer.spans()), 1)
+    # Timed tracing removes itself
+    tracer = start_tracing([(MidiMessage, "note_on")], seconds=0.05)
+    assertEq(isinstance(MidiMessage.__dict__["note_on"], staticmethod), True)
+    assertEq(MidiMessage.__dict__["note_on"] is original, False)
+    time.sleep(0.2)
+    assertEq(MidiMessage.__dict__["note_on"], original)
+    # Stopping also stops wrappers that callers already hold, as when a bound
+    # method is saved in a local variable (as Scheduler.play does)
+    out    = LoopbackMidiOut(VirtualClock())
+    tracer = start_tracing([(LoopbackMidiOut, "send")])
+    send   = out.send
+    for i in range(10):
+        if i == 3:
+            tracer.stop()
+        send(MidiMessage.note_on(1, Note.C4))
+    assertEq((len(tracer.spans()), len(out.sent)), (3, 10))
+    # Concurrent stops restore each target once
+    tracer = start_tracing([(MidiMessage, "note_on")])
+    stoppers = [threading.Thread(target=tracer.stop) for _ in range(4)]
+    for t in stoppers:
+        t.start()
+    for t in stoppers:
+        t.join()
+    assertEq(MidiMessage.__dict__["note_on"], original)
+
+    # Overhead per traced call
+    n  = 200000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        MidiMessage.note_on(1, Note.C4)
+    t1 = time.perf_counter()
+    with tracing([(MidiMessage, "note_on")]) as tracer:
+        for _ in range(n):
+            MidiMessage.note_on(1, Note.C4)
+    t2 = time.perf_counter()
+    print(f"note_on: {(t1-t0)/n*1e9:.0f}ns untraced, {(t2-t1)/n*1e9:.0f}ns traced")
+    with tracing() as tracer:
+        playback.record("scales")
+    print(tracer.format_summary())
+# ----
+
+# End.
@@ -0,0 +1,292 @@
+# tuning.py
+#
+# Alternate tunings, played on 12-TET instruments via per-note pitch bend.
+#
+# Defines:
+#
+#   'Tuning'        a scale of pitches (in cents) repeating at a period, such as
+#                   just intonation or a Scala .scl file, anchored to a root key.
+#   'TuningTable'   for every MIDI key, the nearest 12-TET MIDI note number and the
+#                   14-bit pitch bend that corrects it to the tuned pitch.  Tables
+#                   are computed for all 128 keys at once with NumPy, and stored as
+#                   plain lists so that playing a note is an index, not a calculation.
+#   'MPEAllocator'  MPE-style allocation of each sounding note to its own member
+#                   channel, so that each note can carry its own pitch bend.
+#
+# Note and KeySignature still name keys by their 12-TET position;  a tuning
+# decides what those keys sound like.
+#
+# See:
+#   https://www.huygens-fokker.org/scala/scl_format.html
+#   https://www.midi.org/midi-articles/midi-polyphonic-expression-mpe
+#
+
+from collections import deque
+from fractions import Fraction
+import math
+
+import numpy
+
+from midiutils import assertEq, Note, MidiMessage
+
+# Pitch bend range (semitones) used when none is specified.  Tuning corrections
+# never exceed half a semitone, so a narrow range gives the finest resolution.
+DEFAULT_BEND_RANGE = 2
+
+BEND_CENTRE = 8192
+
+def ratio_to_cents(ratio):
+    return 1200*math.log2(ratio)
+
+# ------------
+# Tuning class
+# ------------
+
+class Tuning:
+    """
+    Represents a tuning as a list of scale pitches within a repeating period.
+    """
+
+    def __init__(self, name, cents, period=1200.0, root=Note.C4, root_offset=0.0):
+        """
+        Create a Tuning object.
+
+        name        is a display name for the tuning
+        cents       is a list of pitches of the scale degrees in cents above the root,
+                    starting with 0.0 for the root itself
+        period      is the interval in cents at which the scale repeats (usually an octave)
+        root        is the Note (key) that plays the root of the scale
+        root_offset is the pitch of the root in cents relative to its 12-TET pitch
+        """
+        self.name        = name
+        self.cents       = list(cents)
+        self.period      = period
+        self.root        = root
+        self.root_offset = root_offset
+        return
+
+    def __str__(self):
+        return f"Tuning({self.name}, {len(self.cents)} notes)"
+
+    @classmethod
+    def equal(cls, divisions=12, period=1200.0, **kwargs):
+        # Equal temperament with the given number of divisions of the period
+        return cls(f"{divisions}-EDO", [period*i/divisions for i in range(divisions)],
+            period=period, **kwargs)
+
+    @classmethod
+    def from_ratios(cls, name, ratios, period=2, **kwargs):
+        # Tuning from frequency ratios (numbers, Fractions or "a/b" strings) above the root
+        return cls(name, [ratio_to_cents(Fraction(r)) for r in ratios],
+            period=ratio_to_cents(Fraction(period)), **kwargs)
+
+    @classmethod
+    def just_intonation(cls, **kwargs):
+        # 5-limit just intonation chromatic scale
+        return cls.from_ratios("5-limit just intonation",
+            [ "1/1", "16/15", "9/8", "6/5", "5/4", "4/3"
+            , "45/32", "3/2", "8/5", "5/3", "9/5", "15/8"
+            ], **kwargs)
+
+    @classmethod
+    def from_scala(cls, text, **kwargs):
+        """
+        Tuning from the contents of a Scala .scl file.
+
+        Pitch lines containing '.' are in cents;  others are ratios or integers.
+        The last pitch listed is the period.
+        """
+        lines = [ l.strip() for l in text.splitlines() if not l.lstrip().startswith("!") ]
+        name  = lines[0] or "Scala tuning"
+        count = int(lines[1].split()[0])
+        pitches = []
+        for l in lines[2:2+count]:
+            value = l.split()[0]
+            if "." in value:
+                pitches.append(float(value))
+            else:
+                pitches.append(ratio_to_cents(Fraction(value)))
+        if len(pitches) != count:
+            raise ValueError(f"Tuning.from_scala: expected {count} pitches, found {len(pitches)}")
+        return cls(name, [0.0]+pitches[:-1], period=pitches[-1], **kwargs)
+
+    @classmethod
+    def read_scala(cls, path, **kwargs):
+        with open(path, encoding="latin-1") as f:
+            return cls.from_scala(f.read(), **kwargs)
+
+# -----------------
+# TuningTable class
+# -----------------
+
+class TuningTable:
+    """
+    Precomputed mapping from each MIDI key (0-127) to the MIDI note number and
+    14-bit pitch bend that sound it in a given tuning.
+
+        midinum[key]    MIDI note number to send, or None if out of range
+        bend[key]       14-bit pitch bend value (8192 = none)
+        bend_lsb[key],
+        bend_msb[key]   pitch bend data bytes, ready to place in a message
+    """
+
+    def __init__(self, tuning, bend_range=DEFAULT_BEND_RANGE):
+        self.tuning     = tuning
+        self.bend_range = bend_range
+        keys    = numpy.arange(128)
+        steps   = len(tuning.cents)
+        period, degree = numpy.divmod(keys - tuning.root.midinum, steps)
+        cents   = numpy.asarray(tuning.cents, dtype=numpy.float64)
+        target  = ( tuning.root.midinum*100.0 + tuning.root_offset +
+                    period*tuning.period + cents[degree] )
+        nearest = numpy.rint(target/100.0)
+        bend    = numpy.rint(BEND_CENTRE + (target - nearest*100.0)*BEND_CENTRE/(bend_range*100.0))
+        bend    = numpy.clip(bend, 0, 16383).astype(numpy.int64)
+        valid   = (nearest >= 0) & (nearest < 128)
+        self.midinum  = [ int(n) if v else None for n, v in zip(nearest.tolist(), valid.tolist()) ]
+        self.bend     = bend.tolist()
+        self.bend_lsb = (bend & 0x7F).tolist()
+        self.bend_msb = (bend >> 7).tolist()
+        return
+
+    def __getitem__(self, key):
+        # Returns (midinum, bend) for the given key number
+        return (self.midinum[key], self.bend[key])
+
+# ------------------
+# MPEAllocator class
+# ------------------
+
+class MPEAllocator:
+    """
+    Allocates notes to MPE member channels, sending each note with the pitch
+    bend from a TuningTable.
+
+    Member channels are assigned least-recently-used first;  when every member
+    channel is sounding, the oldest note is stopped and its channel reused.
+    All lookups are list or dictionary indexing.
+    """
+
+    def __init__(self, table, manager=1, members=15):
+        """
+        Create an MPEAllocator object.
+
+        table       is the TuningTable used to map keys to notes and pitch bends
+        manager     is the zone's manager channel (1 for a lower zone)
+        members     is the number of member channels following the manager channel
+        """
+        self.table    = table
+        self.manager  = manager
+        self.channels = list(range(manager+1, manager+1+members))
+        self.free     = deque(self.channels)
+        self.active   = {}          # key -> (channel, midinum)
+        self.order    = deque()     # keys, oldest first
+        self.bend     = { ch: None for ch in self.channels }
+        return
+
+    def set_table(self, table):
+        # Switch tuning;  applies to notes started after the change
+        self.table = table
+        return
+
+    def configure(self):
+        # Returns list of messages that set up the MPE zone and member pitch bend range
+        msgs = MidiMessage.parameter_number(self.manager, 0x0006, len(self.channels) << 7)
+        for ch in self.channels:
+            msgs += MidiMessage.parameter_number(ch,
+                MidiMessage.RPN_PITCH_BEND_RANGE, self.table.bend_range << 7)
+        return msgs
+
+    def note_on(self, note, velocity=64):
+        """
+        Returns list of messages to start playing a note (a Note or key number).
+        """
+        key   = getattr(note, "midinum", note)
+        table = self.table
+        midinum = table.midinum[key]
+        if midinum is None:
+            return []
+        msgs = []
+        if key in self.active:
+            msgs.extend(self.note_off(key))
+        if not self.free:
+            msgs.extend(self.note_off(self.order[0]))
+        ch   = self.free.popleft()
+        bend = table.bend[key]
+        if self.bend[ch] != bend:
+            msgs.append([0xE0+ch-1, table.bend_lsb[key], table.bend_msb[key]])
+            self.bend[ch] = bend
+        msgs.append([0x90+ch-1, midinum, velocity])
+        self.active[key] = (ch, midinum)
+        self.order.append(key)
+        return msgs
+
+    def note_off(self, note, velocity=64):
+        """
+        Returns list of messages to stop playing a note (a Note or key number).
+        """
+        key = getattr(note, "midinum", note)
+        if key not in self.active:
+            return []
+        ch, midinum = self.active.pop(key)
+        self.order.remove(key)
+        self.free.append(ch)
+        return [[0x80+ch-1, midinum, velocity]]
+
+# ---- Test ----
+if __name__ == "__main__":
+    import time
+    et = TuningTable(Tuning.equal())
+    assertEq(et.midinum[60:72], list(range(60, 72)))
+    assertEq(set(et.bend), {8192})
+    ji = TuningTable(Tuning.just_intonation())
+    # Just major third is 13.7 cents flat of 12-TET;  fifth is 2 cents sharp
+    assertEq(ji[Note.E4.midinum], (64, 8192-561))
+    assertEq(ji[Note.G5.midinum], (79, 8192+80))
+    assertEq(ji[Note.C4.midinum], (60, 8192))
+    # Scala file: mixed cents and ratio pitches, 5 notes per octave
+    scl = """! test.scl
+!
+Pentatonic test
+ 5
+!
+ 200.0
+ 386.3137
+ 3/2
+ 5/3
+ 2/1
+"""
+    pent = TuningTable(Tuning.from_scala(scl))
+    assertEq(pent.tuning.name, "Pentatonic test")
+    assertEq(pent.midinum[60:66], [60, 62, 64, 67, 69, 72])
+    assertEq(pent.midinum[55:60], [48, 50, 52, 55, 57])
+    assertEq(TuningTable(Tuning.equal(24))[61], (60, 8192+2048))
+    # MPE allocation:  each note on its own channel, with its own bend
+    mpe  = MPEAllocator(ji, members=2)
+    assertEq(len(mpe.configure()), 4*3)
+    msgs = mpe.note_on(Note.C4, 100) + mpe.note_on(Note.E4, 100)
+    assertEq(msgs, [ MidiMessage.pitch_bend(2, 8192), [0x91, 60, 100]
+                   , MidiMessage.pitch_bend(3, 8192-561), [0x92, 64, 100] ])
+    # Third note steals the oldest (C4) channel
+    msgs = mpe.note_on(Note.G4, 90)
+    assertEq(msgs, [[0x81, 60, 64], MidiMessage.pitch_bend(2, 8192+80), [0x91, 67, 90]])
+    assertEq(mpe.note_off(Note.E4), [[0x82, 64, 64]])
+    assertEq(mpe.note_off(Note.E4), [])
+    # Note returning to a channel that already has its bend does not resend it
+    mpe.note_off(Note.G4)
+    mpe.note_on(Note.G4)
+    mpe.note_off(Note.G4)
+    assertEq(mpe.note_on(Note.G4), [[0x91, 67, 64]])
+    # Throughput of the send path
+    mpe  = MPEAllocator(ji)
+    keys = list(range(36, 96))*2000
+    t0   = time.perf_counter()
+    for k in keys:
+        mpe.note_on(k)
+        mpe.note_off(k)
+    t1   = time.perf_counter()
+    print(f"{len(keys)} note on/off pairs allocated in {(t1-t0)*1000:.0f}ms "
+          f"({(t1-t0)/len(keys)*1e6:.2f}us per note)")
+# ----
+
+# End.
@@ -0,0 +1,350 @@
+# ump.py
+#
+# MIDI 2.0 Universal MIDI Packet (UMP) encoding and decoding.
+#
+# A UMP is one, two or four 32-bit words, and its length is fixed by the message
+# type in the top 4 bits of its first word.  Streams of packets are held here
+# in array('I') buffers:  fixed-width words pack densely, can be appended or
+# sliced in bulk, and the start of any packet is found without parsing bytes.
+#
+# Supported message types:
+#
+#   0x1     System common and real time (32 bits)
+#   0x2     MIDI 1.0 channel voice (32 bits)
+#   0x4     MIDI 2.0 channel voice (64 bits), with 16-bit velocity and 32-bit
+#           controller, pressure and pitch bend values
+#
+# and translation to and from the MIDI 1.0 byte lists produced by MidiMessage.
+# Values are scaled up using the min-center-max method from the UMP specification
+# and down by truncation, so MIDI 1.0 -> MIDI 2.0 -> MIDI 1.0 is lossless.
+#
+# See: https://midi.org/universal-midi-packet-ump-and-midi-2-0-protocol-specification
+#
+
+from array import array
+
+from midiutils import assertEq, Note, Patch, MidiMessage
+
+# Message types
+MT_UTILITY      = 0x0
+MT_SYSTEM       = 0x1
+MT_MIDI1_VOICE  = 0x2
+MT_DATA64       = 0x3
+MT_MIDI2_VOICE  = 0x4
+
+# Packet size in 32-bit words, indexed by message type
+PACKET_WORDS = (1, 1, 1, 2, 2, 4, 1, 1, 2, 2, 2, 3, 3, 4, 4, 4)
+
+# Number of data bytes following each MIDI 1.0 system status byte (0xF1-0xFF)
+SYSTEM_DATA_BYTES = { 0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0,
+                      0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0, 0xFF: 0 }
+
+# ---- Value scaling ----
+
+def scale_up(value, srcbits, dstbits):
+    # Scale 'value' from 'srcbits' to 'dstbits' bits, mapping minimum, centre
+    # and maximum values exactly (UMP specification min-center-max method)
+    scalebits = dstbits - srcbits
+    shifted   = value << scalebits
+    if value <= (1 << (srcbits-1)):
+        return shifted
+    repeatbits  = srcbits - 1
+    repeatvalue = value & ((1 << repeatbits) - 1)
+    if scalebits > repeatbits:
+        repeatvalue <<= scalebits - repeatbits
+    else:
+        repeatvalue >>= repeatbits - scalebits
+    while repeatvalue:
+        shifted     |= repeatvalue
+        repeatvalue >>= repeatbits
+    return shifted
+
+def scale_down(value, srcbits, dstbits):
+    # Scale 'value' from 'srcbits' to 'dstbits' bits by discarding low-order bits
+    return value >> (srcbits - dstbits)
+
+# Lookup tables used in bulk translation
+_UP_7_16  = [scale_up(v, 7, 16)  for v in range(128)]
+_UP_7_32  = [scale_up(v, 7, 32)  for v in range(128)]
+_UP_14_32 = [scale_up(v, 14, 32) for v in range(16384)]
+
+# -----------
+# UMP class
+# -----------
+
+class UMP:
+    """
+    Provides support functions for generating Universal MIDI Packets.
+
+    Functions return a tuple of 32-bit words;  use 'UMPStream.append' to add
+    them to a buffer.  Channels are 1-16 and groups 0-15, as elsewhere in this
+    project channel numbers follow the user-visible convention.
+    """
+
+    @staticmethod
+    def word(mt, group, status, data1=0, data2=0):
+        # Assemble first word of a packet from message type, group and three bytes
+        return (mt << 28) | (group << 24) | (status << 16) | (data1 << 8) | data2
+
+    @staticmethod
+    def note_on(channel, note, velocity=0x8000, group=0, attr_type=0, attr=0):
+        # channel   MIDI channel number 1-16
+        # note      Note value, instance of Note class
+        # velocity  16-bit velocity (1-65535).  Unlike MIDI 1.0, 0 does not turn a note off.
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0x90+channel-1, note.midinum, attr_type)
+               , (velocity << 16) | attr
+               )
+
+    @staticmethod
+    def note_off(channel, note, velocity=0x8000, group=0, attr_type=0, attr=0):
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0x80+channel-1, note.midinum, attr_type)
+               , (velocity << 16) | attr
+               )
+
+    @staticmethod
+    def control_change(channel, controller, value, group=0):
+        # value     32-bit controller value
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0xB0+channel-1, controller, 0), value )
+
+    @staticmethod
+    def program_change(channel, patch, banknum=None, group=0):
+        # patch     Patch object
+        # banknum   if provided is a bank number 0-16383, selected along with the program
+        if banknum is None:
+            return ( UMP.word(MT_MIDI2_VOICE, group, 0xC0+channel-1, 0, 0)
+                   , (patch.patchnum-1) << 24 )
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0xC0+channel-1, 0, 1)
+               , ((patch.patchnum-1) << 24) | ((banknum >> 7) << 8) | (banknum & 0x7F) )
+
+    @staticmethod
+    def channel_pressure(channel, value, group=0):
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0xD0+channel-1, 0, 0), value )
+
+    @staticmethod
+    def pitch_bend(channel, value, group=0):
+        # value     32-bit unsigned pitch bend, centre 0x80000000
+        return ( UMP.word(MT_MIDI2_VOICE, group, 0xE0+channel-1, 0, 0), value )
+
+# -----------------
+# UMPStream class
+# -----------------
+
+class UMPStream:
+    """
+    A sequence of Universal MIDI Packets held in an array('I') buffer.
+    """
+
+    def __init__(self, words=None):
+        self.words = array('I') if words is None else array('I', words)
+        return
+
+    def __len__(self):
+        # Returns number of 32-bit words (not packets) in the stream
+        return len(self.words)
+
+    def append(self, packet):
+        # Append a packet (tuple of words) to the stream
+        self.words.extend(packet)
+        return
+
+    def packets(self):
+        # Iterator over packets in the stream, each a tuple of words
+        words = self.words
+        i = 0
+        n = len(words)
+        while i < n:
+            size = PACKET_WORDS[words[i] >> 28]
+            yield tuple(words[i:i+size])
+            i += size
+        return
+
+    def offsets(self):
+        # Returns array of word offsets of each packet, for direct indexing
+        offsets = array('I')
+        words   = self.words
+        i = 0
+        n = len(words)
+        while i < n:
+            offsets.append(i)
+            i += PACKET_WORDS[words[i] >> 28]
+        return offsets
+
+# ---- Translation ----
+
+def midi1_to_ump(messages, group=0, midi2=True, out=None):
+    """
+    Translate MIDI 1.0 byte messages to Universal MIDI Packets.
+
+    messages    is an iterable of MidiMessage byte lists (channel voice, system
+                common or real time;  SysEx is not supported)
+    group       is the UMP group (0-15) for all the packets
+    midi2       if True, channel voice messages are translated to MIDI 2.0
+                (type 0x4) packets;  otherwise they are wrapped unchanged as
+                MIDI 1.0 (type 0x2) packets
+    out         if provided is an array('I') to which words are appended
+
+    Returns the array('I') of words.
+
+    A MIDI 1.0 note on with velocity 0 becomes a MIDI 2.0 note off with velocity 0.
+    """
+    if out is None:
+        out = array('I')
+    append  = out.append
+    groupw  = group << 24
+    midi1w  = (MT_MIDI1_VOICE << 28) | groupw
+    midi2w  = (MT_MIDI2_VOICE << 28) | groupw
+    systemw = (MT_SYSTEM << 28) | groupw
+    for m in messages:
+        status = m[0]
+        if status >= 0xF0:
+            if status not in SYSTEM_DATA_BYTES:
+                raise ValueError(f"midi1_to_ump: unsupported message {m}")
+            data1 = m[1] if len(m) > 1 else 0
+            data2 = m[2] if len(m) > 2 else 0
+            append(systemw | (status << 16) | (data1 << 8) | data2)
+            continue
+        kind  = status & 0xF0
+        data1 = m[1]
+        data2 = m[2] if len(m) > 2 else 0
+        if not midi2:
+            append(midi1w | (status << 16) | (data1 << 8) | data2)
+        elif kind == 0x90 or kind == 0x80:
+            if data2 == 0 and kind == 0x90:
+                status = 0x80 | (status & 0x0F)
+                append(midi2w | (status << 16) | (data1 << 8))
+                append(0)
+            else:
+                append(midi2w | (status << 16) | (data1 << 8))
+                append(_UP_7_16[data2] << 16)
+        elif kind == 0xB0 or kind == 0xA0:
+            append(midi2w | (status << 16) | (data1 << 8))
+            append(_UP_7_32[data2])
+        elif kind == 0xC0:
+            append(midi2w | (status << 16))
+            append(data1 << 24)
+        elif kind == 0xD0:
+            append(midi2w | (status << 16))
+            append(_UP_7_32[data1])
+        else:   # 0xE0 pitch bend, LSB first
+            append(midi2w | (status << 16))
+            append(_UP_14_32[(data2 << 7) | data1])
+    return out
+
+def ump_to_midi1(words):
+    """
+    Translate Universal MIDI Packets to MIDI 1.0 byte messages.
+
+    words       is an array('I') (or other sequence) of UMP words
+
+    Returns a list of MidiMessage byte lists.  Utility packets are skipped.
+    A MIDI 2.0 program change with bank is translated to bank select MSB and
+    LSB followed by the program change.  A MIDI 2.0 note on whose velocity
+    scales down to 0 is sent with velocity 1, so it is not taken as a note off.
+    """
+    result = []
+    append = result.append
+    i = 0
+    n = len(words)
+    while i < n:
+        w  = words[i]
+        mt = w >> 28
+        status = (w >> 16) & 0xFF
+        data1  = (w >> 8) & 0xFF
+        data2  = w & 0xFF
+        if mt == MT_MIDI2_VOICE:
+            v    = words[i+1]
+            kind = status & 0xF0
+            if kind == 0x90:
+                append([status, data1, (v >> 25) or 1])
+            elif kind == 0x80:
+                append([status, data1, v >> 25])
+            elif kind == 0xB0 or kind == 0xA0:
+                append([status, data1, v >> 25])
+            elif kind == 0xC0:
+                if data2 & 1:
+                    channel = status & 0x0F
+                    append([0xB0 | channel, MidiMessage.CC_BANK_SELECT, (v >> 8) & 0x7F])
+                    append([0xB0 | channel, MidiMessage.CC_BANK_SELECT+MidiMessage.CC_LSB_OFFSET, v & 0x7F])
+                append([status, v >> 24])
+            elif kind == 0xD0:
+                append([status, v >> 25])
+            elif kind == 0xE0:
+                v >>= 18
+                append([status, v & 0x7F, v >> 7])
+            else:
+                raise ValueError(f"ump_to_midi1: unsupported MIDI 2.0 status {status:#x}")
+        elif mt == MT_MIDI1_VOICE:
+            if (status & 0xF0) in (0xC0, 0xD0):
+                append([status, data1])
+            else:
+                append([status, data1, data2])
+        elif mt == MT_SYSTEM:
+            append([status, data1, data2][:1+SYSTEM_DATA_BYTES.get(status, 0)])
+        elif mt != MT_UTILITY:
+            raise ValueError(f"ump_to_midi1: unsupported message type {mt:#x}")
+        i += PACKET_WORDS[mt]
+    return result
+
+# ---- Test ----
+if __name__ == "__main__":
+    import random
+    import time
+    # Scaling
+    assertEq(scale_up(0, 7, 16),    0)
+    assertEq(scale_up(64, 7, 16),   0x8000)
+    assertEq(scale_up(127, 7, 16),  0xFFFF)
+    assertEq(scale_up(127, 7, 32),  0xFFFFFFFF)
+    assertEq(scale_up(8192, 14, 32), 0x80000000)
+    assertEq(scale_up(16383, 14, 32), 0xFFFFFFFF)
+    for bits, dst in ((7, 16), (7, 32), (14, 32)):
+        for v in range(1 << bits):
+            assertEq(scale_down(scale_up(v, bits, dst), dst, bits), v)
+    # Packet construction
+    s = UMPStream()
+    s.append(UMP.note_on(1, Note.C4, 0xFFFF))
+    s.append(UMP.program_change(2, Patch.REED_ORGAN, banknum=130))
+    s.append(UMP.pitch_bend(1, 0x80000000))
+    assertEq(list(s.words[:2]), [0x40903C00, 0xFFFF0000])
+    assertEq(len(list(s.packets())), 3)
+    assertEq(list(s.offsets()), [0, 2, 4])
+    assertEq(ump_to_midi1(s.words),
+        [ [0x90, 60, 127]
+        , [0xB1, 0, 1], [0xB1, 32, 2], [0xC1, 20]
+        , [0xE0, 0, 64]
+        ])
+    # Round trip through both MIDI 1.0-in-UMP and MIDI 2.0 packets
+    messages = [
+        MidiMessage.note_on(1, Note.C4, 100),
+        MidiMessage.note_off(1, Note.C4, 0),
+        MidiMessage.program_change(3, Patch.CELLO),
+        MidiMessage.control_change(16, MidiMessage.CC_VOLUME, 127),
+        [0xA2, 61, 33], [0xD4, 90], [0xE5, 0x12, 0x55], [0xE5, 0x7F, 0x7F],
+        [0xF8], [0xF2, 0x10, 0x20], [0xF1, 0x35],
+        ]
+    for midi2 in (False, True):
+        words = midi1_to_ump(messages, group=3, midi2=midi2)
+        assertEq(ump_to_midi1(words), messages)
+    assertEq(ump_to_midi1(midi1_to_ump([[0x90, 60, 0]])), [[0x80, 60, 0]])
+    # Bulk translation benchmark
+    rnd = random.Random(1)
+    messages = []
+    for _ in range(250000):
+        ch   = rnd.randrange(16)
+        note = rnd.randrange(128)
+        messages.append([0x90+ch, note, rnd.randrange(1, 128)])
+        messages.append([0xB0+ch, rnd.randrange(120), rnd.randrange(128)])
+        messages.append([0xE0+ch, rnd.randrange(128), rnd.randrange(128)])
+        messages.append([0x80+ch, note, rnd.randrange(128)])
+    t0    = time.perf_counter()
+    words = midi1_to_ump(messages)
+    t1    = time.perf_counter()
+    back  = ump_to_midi1(words)
+    t2    = time.perf_counter()
+    assertEq(back == messages, True)
+    print(f"Translated {len(messages)} messages to {len(words)} UMP words "
+          f"({words.itemsize*len(words)} bytes) in {(t1-t0)*1000:.0f}ms "
+          f"({len(messages)/(t1-t0)/1e6:.2f}M msg/s), and back in {(t2-t1)*1000:.0f}ms "
+          f"({len(messages)/(t2-t1)/1e6:.2f}M msg/s)")
+# ----
+
+# End.